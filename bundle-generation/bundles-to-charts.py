@@ -4,6 +4,7 @@
 # Assumes: Python 3.6+
 
 import argparse
+import functools
 import os
 import shutil
 import yaml
@@ -20,6 +21,53 @@ from validate_csv import *
 # Configure logging with coloredlogs
 coloredlogs.install(level='DEBUG')  # Set the logging level as needed
 
+# Directory of this script, and the directory the source repos are cloned into
+_SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+_TMP_BASE = os.path.join(_SCRIPT_DIR, "tmp")
+
+# Parse and emit with libyaml when PyYAML was built against it, falling back to the pure-Python classes
+try:
+    from yaml import CSafeLoader as _SafeLoader, CSafeDumper as _SafeDumper
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader, SafeDumper as _SafeDumper
+
+# Helm template fragments substituted into the chart templates
+_PULL_POLICY_REF = "{{ .Values.global.pullPolicy }}"
+_RBAC_NAME_PREFIX = "{{ .Values.org }}:{{ .Chart.Name }}:"
+
+# Binding kinds, whose roleRef also gets the RBAC name prefix
+_RBAC_BINDING_KINDS = frozenset({'RoleBinding', 'ClusterRoleBinding'})
+
+# Kinds of the other bundle resources copied into the chart, and every kind a bundle is handled with
+_OTHER_BUNDLE_RESOURCE_KINDS = frozenset({"ClusterRole", "ClusterRoleBinding", "Role", "RoleBinding", "Service", "ConfigMap"})
+_HANDLED_BUNDLE_RESOURCE_KINDS = _OTHER_BUNDLE_RESOURCE_KINDS | {"ClusterManagementAddOn", "CustomResourceDefinition", "ClusterServiceVersion"}
+
+# Helm reference to the override of the given image-key in values.yaml
+@functools.lru_cache(maxsize=None)
+def imageOverrideRef(imageKey):
+    return "{{ .Values.global.imageOverrides." + imageKey + " }}"
+
+# Buffer size for YAML file I/O, large enough that a typical manifest is read or written in one call
+_YAML_BUFFER_SIZE = 1 << 16
+
+# Parse the YAML document at path. libyaml is handed the raw bytes, skipping Python's text decoding.
+def loadYaml(path):
+    with open(path, 'rb', buffering=_YAML_BUFFER_SIZE) as f:
+        return yaml.load(f, Loader=_SafeLoader)
+
+# Write doc to path as YAML. The file is left untouched when its content wouldn't change, which
+# is the case for most templates on a re-run over an already generated chart.
+def saveYaml(path, doc):
+    content = yaml.dump(doc, Dumper=_SafeDumper, encoding='utf-8')
+    try:
+        with open(path, 'rb', buffering=_YAML_BUFFER_SIZE) as f:
+            if f.read() == content:
+                return
+    except FileNotFoundError:
+        pass
+    with open(path, 'wb', buffering=_YAML_BUFFER_SIZE) as f:
+        f.write(content)
+
 # Split a string at a specified delimiter.  If delimiter doesn't exist, consider the
 # string to be all "left-part" (before delimiter) or "right-part" as requested.
 def split_at(the_str, the_delim, favor_right=True):
@@ -37,31 +85,18 @@ def split_at(the_str, the_delim, favor_right=True):
 
     return (left_part, right_part)
 
+# Image ref:  [registry-and-ns/]repository-name[:tag][@digest]
+_IMAGE_REF_RE = re.compile(r'^(?:(?P<registry_and_namespace>.+)/)?(?P<repository>[^/:@]+)(?::(?P<tag>[^/:@]+))?(?:@(?P<digest>.+))?$')
+
 # Parse an image reference, return dict containing image reference information
 def parse_image_ref(image_ref):
-    # Image ref:  [registry-and-ns/]repository-name[:tag][@digest]
-    parsed_ref = dict()
-
-    remaining_ref = image_ref
-    at_pos = remaining_ref.rfind("@")
-    if at_pos > 0:
-        parsed_ref["digest"] = remaining_ref[at_pos+1:]
-        remaining_ref = remaining_ref[0:at_pos]
-    else:
-        parsed_ref["digest"] = None
-    colon_pos = remaining_ref.rfind(":")
-    if colon_pos > 0:
-        parsed_ref["tag"] = remaining_ref[colon_pos+1:]
-        remaining_ref = remaining_ref[0:colon_pos]
-    else:
-        parsed_ref["tag"] = None
-    slash_pos = remaining_ref.rfind("/")
-    if slash_pos > 0:
-        parsed_ref["repository"] = remaining_ref[slash_pos+1:]
-        rgy_and_ns = remaining_ref[0:slash_pos]
+    match = _IMAGE_REF_RE.match(image_ref)
+    if match:
+        parsed_ref = match.groupdict()
     else:
-        parsed_ref["repository"] = remaining_ref
-        rgy_and_ns = "localhost"
+        parsed_ref = {"registry_and_namespace": None, "repository": image_ref, "tag": None, "digest": None}
+
+    rgy_and_ns = parsed_ref["registry_and_namespace"] or "localhost"
     parsed_ref["registry_and_namespace"] = rgy_and_ns
 
     rgy, ns = split_at(rgy_and_ns, "/", favor_right=False)
@@ -100,7 +135,7 @@ def templateHelmChart(outputDir, helmChart, preservedFiles=None, overwrite=False
     directoryPath = os.path.join(outputDir, "charts", "toggle", helmChart)
 
     # Remove existing files if directory exists
-    if os.path.exists(directoryPath):
+    if os.path.isdir(directoryPath):
         logging.debug("Removing existing template files...")
         for filename in os.listdir(os.path.join(directoryPath, "templates")):
             if filename not in preservedFiles:
@@ -117,7 +152,7 @@ def templateHelmChart(outputDir, helmChart, preservedFiles=None, overwrite=False
     logging.debug("Copying template files...")
     for template_file in ["Chart.yaml", "values.yaml"]:
         shutil.copyfile(
-            os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates", template_file),
+            os.path.join(_SCRIPT_DIR, "chart-templates", template_file),
             os.path.join(directoryPath, template_file)
         )
     logging.debug("Template files copied.")
@@ -129,13 +164,11 @@ def fillChartYaml(helmChart, name, csvPath):
     chartYml = os.path.join(helmChart, "Chart.yaml")
 
     # Read Chart.yaml
-    with open(chartYml, 'r') as f:
-        chart = yaml.safe_load(f)
+    chart = loadYaml(chartYml)
 
     # logging.info("%s", csvPath)
     # Read CSV    
-    with open(csvPath, 'r') as f:
-        csv = yaml.safe_load(f)
+    csv = loadYaml(csvPath)
 
     logging.info("Chart Name: %s", helmChart)
     
@@ -149,8 +182,7 @@ def fillChartYaml(helmChart, name, csvPath):
                 logging.info("Description: %s", csv["metadata"]["annotations"]["description"])
                 chart['description'] = csv["metadata"]["annotations"]["description"]
     # chart['version'] = csv['metadata']['name'].split(".", 1)[1][1:]
-    with open(chartYml, 'w') as f:
-        yaml.dump(chart, f)
+    saveYaml(chartYml, chart)
     logging.info("'%s' Chart.yaml updated successfully.\n", helmChart)
 
 # Copy chart-templates/deployment, update it with CSV deployment information, and add to chart
@@ -159,10 +191,9 @@ def addDeployment(helmChart, deployment):
     logging.info("Templating deployment '%s.yaml' ...", name)
 
     deployYaml = os.path.join(helmChart, "templates",  name + ".yaml")
-    shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/deployment.yaml"), deployYaml)
+    shutil.copyfile(os.path.join(_SCRIPT_DIR, "chart-templates/templates/deployment.yaml"), deployYaml)
 
-    with open(deployYaml, 'r') as f:
-        deploy = yaml.safe_load(f)
+    deploy = loadYaml(deployYaml)
         
     deploy['spec'] = deployment['spec']
     if 'spec' in deploy:
@@ -171,8 +202,7 @@ def addDeployment(helmChart, deployment):
                 if 'imagePullPolicy' in deploy['spec']['template']['spec']:
                     del deploy['spec']['template']['spec']['imagePullPolicy']
     deploy['metadata']['name'] = name
-    with open(deployYaml, 'w') as f:
-        yaml.dump(deploy, f)
+    saveYaml(deployYaml, deploy)
     logging.info("Deployment '%s.yaml' updated successfully.\n", name)
 
 # Copy chart-templates/clusterrole,clusterrolebinding,serviceaccount.yaml update it with CSV information, and add to chart
@@ -185,41 +215,35 @@ def addClusterScopedRBAC(helmChart, rbacMap):
     
     # Create Clusterrole
     clusterroleYaml = os.path.join(helmChart, "templates",  name + "-clusterrole.yaml")
-    shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/clusterrole.yaml"), clusterroleYaml)
-    with open(clusterroleYaml, 'r') as f:
-        clusterrole = yaml.safe_load(f)
+    shutil.copyfile(os.path.join(_SCRIPT_DIR, "chart-templates/templates/clusterrole.yaml"), clusterroleYaml)
+    clusterrole = loadYaml(clusterroleYaml)
     # Edit Clusterrole
     clusterrole["rules"] = rbacMap["rules"]
     clusterrole["metadata"]["name"] = name
     # Save Clusterrole
-    with open(clusterroleYaml, 'w') as f:
-        yaml.dump(clusterrole, f)
+    saveYaml(clusterroleYaml, clusterrole)
     logging.info("Clusterrole '%s-clusterrole.yaml' updated successfully.", name)
     
     logging.info("Templating serviceaccount '%s-serviceaccount.yaml' ...", name)
     # Create Serviceaccount
     serviceAccountYaml = os.path.join(helmChart, "templates",  name + "-serviceaccount.yaml")
-    shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/serviceaccount.yaml"), serviceAccountYaml)
-    with open(serviceAccountYaml, 'r') as f:
-        serviceAccount = yaml.safe_load(f)
+    shutil.copyfile(os.path.join(_SCRIPT_DIR, "chart-templates/templates/serviceaccount.yaml"), serviceAccountYaml)
+    serviceAccount = loadYaml(serviceAccountYaml)
     # Edit Serviceaccount
     serviceAccount["metadata"]["name"] = name
     # Save Serviceaccount
-    with open(serviceAccountYaml, 'w') as f:
-        yaml.dump(serviceAccount, f)
+    saveYaml(serviceAccountYaml, serviceAccount)
     logging.info("Serviceaccount '%s-serviceaccount.yaml' updated successfully.", name)
 
     logging.info("Templating clusterrolebinding '%s-clusterrolebinding.yaml' ...", name)
     # Create Clusterrolebinding
     clusterrolebindingYaml = os.path.join(helmChart, "templates",  name + "-clusterrolebinding.yaml")
-    shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/clusterrolebinding.yaml"), clusterrolebindingYaml)
-    with open(clusterrolebindingYaml, 'r') as f:
-        clusterrolebinding = yaml.safe_load(f)
+    shutil.copyfile(os.path.join(_SCRIPT_DIR, "chart-templates/templates/clusterrolebinding.yaml"), clusterrolebindingYaml)
+    clusterrolebinding = loadYaml(clusterrolebindingYaml)
     clusterrolebinding['metadata']['name'] = name
     clusterrolebinding['roleRef']['name'] = clusterrole["metadata"]["name"]
     clusterrolebinding['subjects'][0]['name'] = name
-    with open(clusterrolebindingYaml, 'w') as f:
-        yaml.dump(clusterrolebinding, f)
+    saveYaml(clusterrolebindingYaml, clusterrolebinding)
     logging.info("Clusterrolebinding '%s-clusterrolebinding.yaml' updated successfully.", name)
     logging.info("Cluster scoped RBAC created.\n")
 
@@ -231,42 +255,36 @@ def addNamespaceScopedRBAC(helmChart, rbacMap):
     logging.info("Templating role '%s-role.yaml' ...", name)
     # Create role
     roleYaml = os.path.join(helmChart, "templates",  name + "-role.yaml")
-    shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/role.yaml"), roleYaml)
-    with open(roleYaml, 'r') as f:
-        role = yaml.safe_load(f)
+    shutil.copyfile(os.path.join(_SCRIPT_DIR, "chart-templates/templates/role.yaml"), roleYaml)
+    role = loadYaml(roleYaml)
     # Edit role
     role["rules"] = rbacMap["rules"]
     role["metadata"]["name"] = name
     # Save role
-    with open(roleYaml, 'w') as f:
-        yaml.dump(role, f)
+    saveYaml(roleYaml, role)
     logging.info("Role '%s-role.yaml' updated successfully.", name)
     
     # Create Serviceaccount
     serviceAccountYaml = os.path.join(helmChart, "templates",  name + "-serviceaccount.yaml")
     if not os.path.isfile(serviceAccountYaml):
         logging.info("Serviceaccount doesnt exist. Templating '%s-serviceaccount.yaml' ...", name)
-        shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/serviceaccount.yaml"), serviceAccountYaml)
-        with open(serviceAccountYaml, 'r') as f:
-            serviceAccount = yaml.safe_load(f)
+        shutil.copyfile(os.path.join(_SCRIPT_DIR, "chart-templates/templates/serviceaccount.yaml"), serviceAccountYaml)
+        serviceAccount = loadYaml(serviceAccountYaml)
         # Edit Serviceaccount
         serviceAccount["metadata"]["name"] = name
         # Save Serviceaccount
-        with open(serviceAccountYaml, 'w') as f:
-            yaml.dump(serviceAccount, f)
+        saveYaml(serviceAccountYaml, serviceAccount)
         logging.info("Serviceaccount '%s-serviceaccount.yaml' updated successfully.", name)
 
     logging.info("Templating rolebinding '%s-rolebinding.yaml' ...", name)
     # Create rolebinding
     rolebindingYaml = os.path.join(helmChart, "templates",  name + "-rolebinding.yaml")
-    shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/rolebinding.yaml"), rolebindingYaml)
-    with open(rolebindingYaml, 'r') as f:
-        rolebinding = yaml.safe_load(f)
+    shutil.copyfile(os.path.join(_SCRIPT_DIR, "chart-templates/templates/rolebinding.yaml"), rolebindingYaml)
+    rolebinding = loadYaml(rolebindingYaml)
     rolebinding['metadata']['name'] = name
     rolebinding['roleRef']['name'] = role["metadata"]["name"] = name
     rolebinding['subjects'][0]['name'] = name
-    with open(rolebindingYaml, 'w') as f:
-        yaml.dump(rolebinding, f)
+    saveYaml(rolebindingYaml, rolebinding)
     logging.info("Rolebinding '%s-rolebinding.yaml' updated successfully.", name)
     logging.info("Namespace scoped RBAC created.\n")
 
@@ -275,8 +293,7 @@ def addResources(helmChart, csvPath):
     logging.info("Reading CSV '%s'\n", csvPath)
 
     # Read CSV    
-    with open(csvPath, 'r') as f:
-        csv = yaml.safe_load(f)
+    csv = loadYaml(csvPath)
     
     logging.info("Checking for deployments, clusterpermissions, and permissions.\n")
     # Check for deployments
@@ -306,20 +323,15 @@ def addResources(helmChart, csvPath):
     logging.info("Copying over other resources in the bundle if they exist ...")
     dirPath = os.path.dirname(csvPath)
     logging.info("From directory '%s'", dirPath)
-    otherBundleResourceTypes = ["ClusterRole", "ClusterRoleBinding", "Role", "RoleBinding", "Service", "ConfigMap"]
-    # list of files we handle currently
-    listOfFilesAdded = ["ClusterRole", "ClusterRoleBinding", "Role", 
-    "RoleBinding", "Service", "ClusterManagementAddOn", "CustomResourceDefinition", "ClusterServiceVersion", "ConfigMap"]
     for filename in os.listdir(dirPath):
         if filename.endswith(".yaml") or filename.endswith(".yml"):
             filePath = os.path.join(dirPath, filename)
-            with open(filePath, 'r') as f:
-                fileYml = yaml.safe_load(f)
+            fileYml = loadYaml(filePath)
             if "kind" not in fileYml:
                 continue
-            if fileYml['kind'] in otherBundleResourceTypes:
+            if fileYml['kind'] in _OTHER_BUNDLE_RESOURCE_KINDS:
                 shutil.copyfile(filePath, os.path.join(helmChart, "templates", os.path.basename(filePath)))
-            if fileYml['kind'] not in listOfFilesAdded:
+            if fileYml['kind'] not in _HANDLED_BUNDLE_RESOURCE_KINDS:
                 logging.error("Found a file of a resource that is not being handled called '%s' in '%s", fileYml['kind'],dirPath)
                 handleAllFiles = True
             continue
@@ -328,90 +340,103 @@ def addResources(helmChart, csvPath):
     if handleAllFiles:
         logging.error("Found a resource in either the manifest or csv we aren't handling")
         sys.exit(1)
+
+# Template paths of a chart grouped by resource kind, keyed by chart directory. Built on the first
+# lookup and dropped by invalidateChartKindIndex once the chart has been onboarded.
+_CHART_KIND_INDEX = {}
+
+_KIND_LINE_RE = re.compile(r'^kind:\s*["\']?([\w.-]+)', re.MULTILINE)
+
+# Return the resource kind of a YAML file from its top-level `kind:` line, which is looked for in the
+# complete lines of the first few KB only. Files without one there fall back to a full parse, and None
+# if they have no kind.
+def readKind(filePath):
+    with open(filePath, 'r') as f:
+        head = f.read(4096)
+    if len(head) == 4096:
+        # Drop the last, possibly cut off, line so a kind split at the boundary isn't read partially
+        head = head[:head.rfind('\n') + 1]
+    match = _KIND_LINE_RE.search(head)
+    if match:
+        return match.group(1)
+    return (loadYaml(filePath) or {}).get('kind')
+
+# Map every resource kind in a chart's templates directory to the template paths of that kind
+def chartKindIndex(helmChart):
+    helmChart = os.path.abspath(helmChart)
+    if helmChart in _CHART_KIND_INDEX:
+        return _CHART_KIND_INDEX[helmChart]
+    index = {}
+    with os.scandir(os.path.join(helmChart, "templates")) as it:
+        templates = [entry.path for entry in it if entry.name.endswith((".yaml", ".yml"))]
+    for filePath in templates:
+        index.setdefault(readKind(filePath), []).append(filePath)
+    _CHART_KIND_INDEX[helmChart] = index
+    return index
+
+def invalidateChartKindIndex(helmChart):
+    _CHART_KIND_INDEX.pop(os.path.abspath(helmChart), None)
+
 # Given a resource Kind, return all filepaths of that resource type in a chart directory
 def findTemplatesOfType(helmChart, kind):
-    resources = []
-    for filename in os.listdir(os.path.join(helmChart, "templates")):
-        if filename.endswith(".yaml") or filename.endswith(".yml"):
-            filePath = os.path.join(helmChart, "templates", filename)
-            with open(filePath, 'r') as f:
-                fileYml = yaml.safe_load(f)
-            if fileYml['kind'] == kind:
-                resources.append(filePath)
-            continue
-        else:
-            continue
-    return resources
+    return list(chartKindIndex(helmChart).get(kind, []))
 
-# For each deployment, identify the image references if any exist in the environment variable fields, insert helm flow control code to reference it, and add image-key to the values.yaml file.
+# For a deployment, identify the image references if any exist in the environment variable fields and insert helm flow control code to reference them.
+# Returns the image-keys referenced so they can be added to the values.yaml file.
 # If the image-key referenced in the deployment does not exist in `imageMappings` in the Config.yaml, this will fail. Images must be explicitly defined
-def fixEnvVarImageReferences(helmChart, imageKeyMapping):
-    logging.info("Fixing image references in container 'env' section in deployments and values.yaml ...")
-    valuesYaml = os.path.join(helmChart, "values.yaml")
-    with open(valuesYaml, 'r') as f:
-        values = yaml.safe_load(f)
-    deployments = findTemplatesOfType(helmChart, 'Deployment')
-
+def fixEnvVarImageReferences(deploy, imageKeyMapping):
     imageKeys = []
-    for deployment in deployments:
-        with open(deployment, 'r') as f:
-            deploy = yaml.safe_load(f)
+    containers = deploy['spec']['template']['spec']['containers']
+    for container in containers:
+        if 'env' not in container: 
+            continue
         
-        containers = deploy['spec']['template']['spec']['containers']
-        for container in containers:
-            if 'env' not in container: 
+        for env in container['env']:
+            image_key = env['name']
+            if image_key.endswith('_IMAGE') == False:
                 continue
-            
-            for env in container['env']:
-                image_key = env['name']
-                if image_key.endswith('_IMAGE') == False:
-                    continue
-                image_key = parse_image_ref(env['value'])['repository']
-                try:
-                    image_key = imageKeyMapping[image_key]
-                except KeyError:
-                    logging.critical("No image key mapping provided for imageKey: %s" % image_key)
-                    exit(1)
-                imageKeys.append(image_key)
-                env['value'] = "{{ .Values.global.imageOverrides." + image_key + " }}"
-        with open(deployment, 'w') as f:
-            yaml.dump(deploy, f)
-
-    for imageKey in imageKeys:
-        values['global']['imageOverrides'][imageKey] = ""
-    with open(valuesYaml, 'w') as f:
-        yaml.dump(values, f)
-    logging.info("Image container env references in deployments and values.yaml updated successfully.\n")
-
-# For each deployment, identify the image references if any exist in the image field, insert helm flow control code to reference it, and add image-key to the values.yaml file.
-# If the image-key referenced in the deployment does not exist in `imageMappings` in the Config.yaml, this will fail. Images must be explicitly defined
-def fixImageReferences(helmChart, imageKeyMapping):
-    logging.info("Fixing image and pull policy references in deployments and values.yaml ...")
-    valuesYaml = os.path.join(helmChart, "values.yaml")
-    with open(valuesYaml, 'r') as f:
-        values = yaml.safe_load(f)
-    
-    deployments = findTemplatesOfType(helmChart, 'Deployment')
-    imageKeys = []
-    temp = "" ## temporarily read image ref
-    for deployment in deployments:
-        with open(deployment, 'r') as f:
-            deploy = yaml.safe_load(f)
-        
-        containers = deploy['spec']['template']['spec']['containers']
-        for container in containers:
-            image_key = parse_image_ref(container['image'])["repository"]
+            image_key = parse_image_ref(env['value'])['repository']
             try:
                 image_key = imageKeyMapping[image_key]
             except KeyError:
                 logging.critical("No image key mapping provided for imageKey: %s" % image_key)
                 exit(1)
             imageKeys.append(image_key)
-            # temp = container['image'] 
-            container['image'] = "{{ .Values.global.imageOverrides." + image_key + " }}"
-            container['imagePullPolicy'] = "{{ .Values.global.pullPolicy }}"
-        with open(deployment, 'w') as f:
-            yaml.dump(deploy, f)
+            env['value'] = imageOverrideRef(image_key)
+    return imageKeys
+
+# For a deployment, identify the image references if any exist in the image field and insert helm flow control code to reference them.
+# Returns the image-keys referenced so they can be added to the values.yaml file.
+# If the image-key referenced in the deployment does not exist in `imageMappings` in the Config.yaml, this will fail. Images must be explicitly defined
+def fixImageReferences(deploy, imageKeyMapping):
+    imageKeys = []
+    containers = deploy['spec']['template']['spec']['containers']
+    for container in containers:
+        image_key = parse_image_ref(container['image'])["repository"]
+        try:
+            image_key = imageKeyMapping[image_key]
+        except KeyError:
+            logging.critical("No image key mapping provided for imageKey: %s" % image_key)
+            exit(1)
+        imageKeys.append(image_key)
+        container['image'] = imageOverrideRef(image_key)
+        container['imagePullPolicy'] = _PULL_POLICY_REF
+    return imageKeys
+
+# For each deployment, fix the image references in both the image and environment variable fields, reading and
+# writing each deployment once, and add the image-keys to the values.yaml file.
+def fixAllImageReferences(helmChart, imageKeyMapping):
+    logging.info("Fixing image, pull policy and container 'env' image references in deployments and values.yaml ...")
+    valuesYaml = os.path.join(helmChart, "values.yaml")
+    values = loadYaml(valuesYaml)
+
+    deployments = findTemplatesOfType(helmChart, 'Deployment')
+    imageKeys = []
+    for deployment in deployments:
+        deploy = loadYaml(deployment)
+        imageKeys += fixImageReferences(deploy, imageKeyMapping)
+        imageKeys += fixEnvVarImageReferences(deploy, imageKeyMapping)
+        saveYaml(deployment, deploy)
 
     # Remove the placeholder/dummy image overrides we might get from our values template
     try:
@@ -420,8 +445,7 @@ def fixImageReferences(helmChart, imageKeyMapping):
         pass
     for imageKey in imageKeys:
         values['global']['imageOverrides'][imageKey] = "" # set to temp to debug
-    with open(valuesYaml, 'w') as f:
-        yaml.dump(values, f)
+    saveYaml(valuesYaml, values)
     logging.info("Image references and pull policy in deployments and values.yaml updated successfully.\n")
 
 # insers Heml flow control if/end block around a first and last line without changing
@@ -430,48 +454,68 @@ def insertFlowControlIfAround(lines_list, first_line_index, last_line_index, if_
    lines_list[first_line_index] = "{{- if %s }}\n%s" % (if_condition, lines_list[first_line_index])
    lines_list[last_line_index] = "%s{{- end }}\n" % lines_list[last_line_index]
 
+# Extract the version part from the branch name (e.g., '2.12-integration' -> '2.12').
+# Compiled once at import rather than looked up in the re cache on every call.
+_BRANCH_VERSION_RE = re.compile(r'(\d+\.\d+)')  # Matches versions like '2.12'
+
+# Parse a version string, reusing the Version object for versions parsed before
+@functools.lru_cache(maxsize=None)
+def parseVersion(v):
+    return version.Version(v)
+
+# The result depends only on the arguments, and every deployment of a chart asks the same questions
+# about the same branch, so answers are cached.
+@functools.lru_cache(maxsize=None)
 def is_version_compatible(branch, min_release_version, min_backplane_version, min_ocm_version, enforce_master_check=True):
-    # Extract the version part from the branch name (e.g., '2.12-integration' -> '2.12')
-    pattern = r'(\d+\.\d+)'  # Matches versions like '2.12'
-    
     if branch == "main" or branch == "master":
         if enforce_master_check:
             return True
         else:
             return False
     
-    match = re.search(pattern, branch)
+    match = _BRANCH_VERSION_RE.search(branch)
     if match:
         v = match.group(1)  # Extract the version
-        branch_version = version.Version(v)  # Create a Version object
+        branch_version = parseVersion(v)  # Create a Version object
         
         if "release-ocm" in branch:
-            min_branch_version = version.Version(min_ocm_version)  # Use the minimum release version
+            min_branch_version = parseVersion(min_ocm_version)  # Use the minimum release version
         
         elif "release" in branch:
-            min_branch_version = version.Version(min_release_version)  # Use the minimum release version
+            min_branch_version = parseVersion(min_release_version)  # Use the minimum release version
 
         elif "backplane" in branch or "mce" in branch:
-            min_branch_version = version.Version(min_backplane_version)  # Use the minimum backplane version
+            min_branch_version = parseVersion(min_backplane_version)  # Use the minimum backplane version
 
         else:
-            logging.error(f"Unrecognized branch type for branch: {branch}")
+            logging.error("Unrecognized branch type for branch: %s", branch)
             return False
 
         # Check if the branch version is compatible with the specified minimum branch
         return branch_version >= min_branch_version
 
     else:
-        logging.error(f"Version not found in branch: {branch}")
+        logging.error("Version not found in branch: %s", branch)
         return False
 
+# Index the sizes.yaml content by deployment name and then container name
+def indexSizes(sizes):
+    if not sizes:
+        return {}
+    return {d["name"]: {c["name"]: c for c in d["containers"]} for d in sizes["deployments"]}
+
 # injectHelmFlowControl injects advanced helm flow control which would typically make a .yaml file more difficult to parse. This should be called last.
 def injectHelmFlowControl(deployment, sizes, branch):
     logging.info("Adding Helm flow control for NodeSelector, Proxy Overrides and SecCompProfile...")
     deploy = open(deployment, "r")
-    with open(deployment, 'r') as f:
-        deployx = yaml.safe_load(f)
+    deployx = loadYaml(deployment)
+    # Resource placeholder lines left by updateDeployments, mapped to the sizes of their container
+    containerSizes = indexSizes(sizes).get(deployx["metadata"]["name"], {})
+    resourcePlaceholders = {"resources: REPLACE-" + name: container for name, container in containerSizes.items()}
     lines = deploy.readlines()
+    # Both checks depend only on the branch, so evaluate them once rather than per line
+    replicaCountSupported = is_version_compatible(branch, '9.9', '9.9', '9.9', False)
+    deployOnOCPSupported = is_version_compatible(branch, '9.9', '2.7', '2.12')
     for i, line in enumerate(lines):
         if line.strip() == "nodeSelector: \'\'":
             lines[i] = """{{- with .Values.hubconfig.nodeSelector }}
@@ -510,17 +554,14 @@ def injectHelmFlowControl(deployment, sizes, branch):
 {{- end }}
 """     
 
-        if is_version_compatible(branch, '9.9', '9.9', '9.9', False):
+        if replicaCountSupported:
             if 'replicas:' in line.strip():
                 lines[i] = """  replicas: {{ .Values.hubconfig.replicaCount }}
 """
             
-        if sizes:
-            for sizDeployment in sizes["deployments"]:
-                if sizDeployment["name"] == deployx["metadata"]["name"]:
-                    for container in sizDeployment["containers"]:
-                        if line.strip() == "resources: REPLACE-" + container["name"]:
-                            lines[i] = """        resources:
+        container = resourcePlaceholders.get(line.strip())
+        if container is not None:
+            lines[i] = """        resources:
 {{-  if eq .values.hubconfig.hubSize "Small" }}
           limits:
             cpu: """ + container["Small"]["limits"]["cpu"] + """
@@ -558,7 +599,7 @@ def injectHelmFlowControl(deployment, sizes, branch):
             next_line = lines[i+1]  # Ignore possible reach beyond end-of-list, not really possible
             if next_line.strip() == "type: RuntimeDefault":
                 insertFlowControlIfAround(lines, i, i+1, "semverCompare \">=4.11.0\" .Values.hubconfig.ocpVersion")
-                if is_version_compatible(branch, '9.9', '2.7', '2.12'):
+                if deployOnOCPSupported:
                     insertFlowControlIfAround(lines, i, i+1, ".Values.global.deployOnOCP")
     #
     a_file = open(deployment, "w")
@@ -569,29 +610,25 @@ def injectHelmFlowControl(deployment, sizes, branch):
 # updateDeployments adds standard configuration to the deployments (antiaffinity, security policies, and tolerations)
 def updateDeployments(helmChart, operator, exclusions, sizes, branch):
     logging.info("Updating deployments with antiaffinity, security policies, and tolerations ...")
-    deploySpecYaml = os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/deploymentspec.yaml")
-    with open(deploySpecYaml, 'r') as f:
-        deploySpec = yaml.safe_load(f)
+    deploySpecYaml = os.path.join(_SCRIPT_DIR, "chart-templates/templates/deploymentspec.yaml")
+    deploySpec = loadYaml(deploySpecYaml)
+    sizesByDeployment = indexSizes(sizes)
     deployments = findTemplatesOfType(helmChart, 'Deployment')
     for deployment in deployments:
-        with open(deployment, 'r') as f:
-            deploy = yaml.safe_load(f)
+        deploy = loadYaml(deployment)
         affinityList = deploySpec['affinity']['podAntiAffinity']['preferredDuringSchedulingIgnoredDuringExecution']
         for antiaffinity in affinityList:
             antiaffinity['podAffinityTerm']['labelSelector']['matchExpressions'][0]['values'][0] = deploy['metadata']['name']
 
         pod_template = deploy['spec']['template']
         pod_template['metadata']['labels']['ocm-antiaffinity-selector'] = deploy['metadata']['name']
-        if sizes:
-            for  sizDeployment in sizes["deployments"]:
-                if sizDeployment["name"] == deploy["metadata"]["name"]:
-                    for i in deploy['spec']['template']['spec']['containers']:            
-                        if not any(d['name'] == i['name'] for d in sizDeployment["containers"]):
-                            logging.error("Missing container in sizes.yaml")
-                            exit(1)
-                        for sizContainer in sizDeployment["containers"]:
-                            if sizContainer["name"] == i["name"]:
-                                i['resources'] = 'REPLACE-' + i['name']
+        containerSizes = sizesByDeployment.get(deploy["metadata"]["name"])
+        if containerSizes is not None:
+            for i in deploy['spec']['template']['spec']['containers']:
+                if i['name'] not in containerSizes:
+                    logging.error("Missing container in sizes.yaml")
+                    exit(1)
+                i['resources'] = 'REPLACE-' + i['name']
 
         pod_template_spec = pod_template['spec']
         pod_template_spec['affinity'] = deploySpec['affinity']
@@ -646,8 +683,7 @@ def updateDeployments(helmChart, operator, exclusions, sizes, branch):
                     logging.warning("Leaving non-standard seccompprofile setting for container %s" % container_name)
 
         
-        with open(deployment, 'w') as f:
-            yaml.dump(deploy, f)
+        saveYaml(deployment, deploy)
         logging.info("Deployments updated with antiaffinity, security policies, and tolerations successfully. \n")
 
         injectHelmFlowControl(deployment, sizes, branch)
@@ -661,13 +697,11 @@ def updateRBAC(helmChart):
     rolebindings = findTemplatesOfType(helmChart, 'RoleBinding')
 
     for rbacFile in clusterroles + roles + clusterrolebindings + rolebindings:
-        with open(rbacFile, 'r') as f:
-            rbac = yaml.safe_load(f)
-        rbac['metadata']['name'] = "{{ .Values.org }}:{{ .Chart.Name }}:" + rbac['metadata']['name']
-        if rbac['kind'] in ['RoleBinding', 'ClusterRoleBinding']:
-            rbac['roleRef']['name'] = "{{ .Values.org }}:{{ .Chart.Name }}:" + rbac['roleRef']['name']
-        with open(rbacFile, 'w') as f:
-            yaml.dump(rbac, f)
+        rbac = loadYaml(rbacFile)
+        rbac['metadata']['name'] = _RBAC_NAME_PREFIX + rbac['metadata']['name']
+        if rbac['kind'] in _RBAC_BINDING_KINDS:
+            rbac['roleRef']['name'] = _RBAC_NAME_PREFIX + rbac['roleRef']['name']
+        saveYaml(rbacFile, rbac)
     logging.info("Clusterroles, roles, clusterrolebindings, and rolebindings updated. \n")
 
 
@@ -676,35 +710,32 @@ def injectRequirements(helmChart, operator, exclusions, sizes, branch):
     imageKeyMapping = operator.get('imageMappings', {})
 
     # Fixes image references in the Helm chart.
-    fixImageReferences(helmChart, imageKeyMapping)
-    fixEnvVarImageReferences(helmChart, imageKeyMapping)
+    fixAllImageReferences(helmChart, imageKeyMapping)
 
     # Updates RBAC and deployment configuration in the Helm chart.
     updateRBAC(helmChart)
     updateDeployments(helmChart, operator, exclusions, sizes, branch)
 
+    invalidateChartKindIndex(helmChart)
     logging.info("Updated Chart '%s' successfully\n", helmChart)
 
+# Return (filename, path) of the YAML manifests in a bundle's manifests directory
+def listManifests(manifestsPath):
+    with os.scandir(manifestsPath) as it:
+        return [(entry.name, entry.path) for entry in it if entry.name.endswith(".yaml")]
+
 def addCMAs(repo, operator, outputDir):
     if 'bundlePath' in operator:
-        manifestsPath = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, operator["bundlePath"])
-        if not os.path.exists(manifestsPath):
+        manifestsPath = os.path.join(_TMP_BASE, repo, operator["bundlePath"])
+        if not os.path.isdir(manifestsPath):
             logging.critical("Could not validate bundlePath at given path: " + operator["bundlePath"])
             exit(1)
     else:
         bundlePath = getBundleManifestsPath(repo, operator)
         manifestsPath = os.path.join(bundlePath, "manifests")
 
-    for filename in os.listdir(manifestsPath):
-        if not filename.endswith(".yaml"): 
-            continue
-        filepath = os.path.join(manifestsPath, filename)
-        with open(filepath, 'r') as f:
-            resourceFile = yaml.safe_load(f)
-
-        if "kind" not in resourceFile:
-            continue
-        elif resourceFile["kind"] == "ClusterManagementAddOn":
+    for filename, filepath in listManifests(manifestsPath):
+        if readKind(filepath) == "ClusterManagementAddOn":
             logging.info("CMA")
             shutil.copyfile(filepath, os.path.join(outputDir, "charts", "toggle", operator['name'], "templates", filename))
 
@@ -725,8 +756,8 @@ def addCRDs(repo, operator, outputDir, preservedFiles=None, overwrite=False):
     logging.info("Adding Custom Resource Definitions (CRDs) for operator: %s", operator['name'])
 
     if 'bundlePath' in operator:
-        manifestsPath = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, operator["bundlePath"])
-        if not os.path.exists(manifestsPath):
+        manifestsPath = os.path.join(_TMP_BASE, repo, operator["bundlePath"])
+        if not os.path.isdir(manifestsPath):
             raise ValueError("Could not validate bundlePath at given path: " + operator["bundlePath"])
         else:
             logging.info("Using specified bundlePath for CRDs: %s", operator["bundlePath"])
@@ -740,32 +771,22 @@ def addCRDs(repo, operator, outputDir, preservedFiles=None, overwrite=False):
         preservedFiles = []
 
     directoryPath = os.path.join(outputDir, "crds", operator['name'])
-    if os.path.exists(directoryPath):
+    if os.path.isdir(directoryPath):
         logging.debug("Removing existing CRD files...")
-        for filename in os.listdir(directoryPath):
-            if filename not in preservedFiles:
-                filepath = os.path.join(directoryPath, filename)
-                os.remove(filepath)
+        with os.scandir(directoryPath) as it:
+            for entry in it:
+                if entry.name not in preservedFiles:
+                    os.remove(entry.path)
         logging.debug("Existing CRD files removed.")
 
     else:
         os.makedirs(directoryPath)
         logging.debug("Created directory for CRDs: %s", directoryPath)
 
-    for filename in os.listdir(manifestsPath):
-        if not filename.endswith(".yaml"): 
-            continue
-
-        filepath = os.path.join(manifestsPath, filename)
-        with open(filepath, 'r') as f:
-            resourceFile = yaml.safe_load(f)
-
-        if "kind" not in resourceFile:
-            continue
-
-        elif resourceFile["kind"] == "CustomResourceDefinition":
+    for filename, filepath in listManifests(manifestsPath):
+        if readKind(filepath) == "CustomResourceDefinition":
             dest_file_path = os.path.join(outputDir, "crds", operator['name'], filename)
-            if overwrite or not os.path.exists(dest_file_path):
+            if overwrite or not os.path.isfile(dest_file_path):
                 shutil.copyfile(filepath, dest_file_path)
                 logging.info("CRD file copied: %s", filename)
 
@@ -777,22 +798,22 @@ def getBundleManifestsPath(repo, operator):
     of the latest operator bundle available in the desired channel
     """
     if 'bundlePath' in operator:
-        bundlePath = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, operator["bundlePath"])
-        if not os.path.exists(bundlePath):
+        bundlePath = os.path.join(_TMP_BASE, repo, operator["bundlePath"])
+        if not os.path.isdir(bundlePath):
             logging.critical("Could not validate bundlePath at given path: " + operator["bundlePath"])
             exit(1)
         return bundlePath
     
     # check every bundle's metadata for its supported channels
-    bundles_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, operator["bundles-directory"])
-    if not os.path.exists(bundles_directory):
+    bundles_directory = os.path.join(_TMP_BASE, repo, operator["bundles-directory"])
+    if not os.path.isdir(bundles_directory):
         logging.critical("Could not find bundles at given path: " + operator["bundles-directory"])
         exit(1)
 
     latest_bundle_version = "0.0.0"
-    directories = [dir for dir in os.listdir(bundles_directory) if os.path.isdir(os.path.join(bundles_directory, dir))]
-    for dir_name in directories:
-        bundle_path = os.path.join(bundles_directory, dir_name)
+    with os.scandir(bundles_directory) as it:
+        directories = [(entry.name, entry.path) for entry in it if entry.is_dir()]
+    for dir_name, bundle_path in directories:
         
         # Read metadata annotations
         annotations_file = os.path.join(bundle_path, "metadata", "annotations.yaml")
@@ -800,7 +821,7 @@ def getBundleManifestsPath(repo, operator):
             logging.critical("Could not find annotations at given path: " + annotations_file)
             exit(1)
         with open(annotations_file, 'r') as f:
-            annotations = yaml.safe_load(f)
+            annotations = yaml.load(f, Loader=_SafeLoader)
             channels = annotations.get('annotations', {}).get('operators.operatorframework.io.bundle.channels.v1').split(',')
             if not channels:
                 logging.critical("Could not find channels in annotations file at given path: " + annotations_file)
@@ -815,8 +836,8 @@ def getBundleManifestsPath(repo, operator):
 
 def getCSVPath(repo, operator):
     if 'bundlePath' in operator:
-        manifestsPath = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, operator["bundlePath"])
-        if not os.path.exists(manifestsPath):
+        manifestsPath = os.path.join(_TMP_BASE, repo, operator["bundlePath"])
+        if not os.path.isdir(manifestsPath):
             logging.critical("Could not validate bundlePath at given path: " + operator["bundlePath"])
             exit(1)
         else:
@@ -834,13 +855,7 @@ def getCSVPath(repo, operator):
             continue
 
         filepath = os.path.join(manifestsPath, filename)
-        with open(filepath, 'r') as f:
-            resourceFile = yaml.safe_load(f)
-
-        if "kind" not in resourceFile:
-            continue
-
-        elif resourceFile["kind"] == "ClusterServiceVersion":
+        if readKind(filepath) == "ClusterServiceVersion":
             logging.info("CSV file found: %s", filepath)
             return filepath
 
@@ -866,9 +881,8 @@ def main():
         exit(1)
 
     # Config.yaml holds the configurations for Operator bundle locations to be used
-    configYaml = os.path.join(os.path.dirname(os.path.realpath(__file__)),"config.yaml")
-    with open(configYaml, 'r') as f:
-        config = yaml.safe_load(f)
+    configYaml = os.path.join(_SCRIPT_DIR, "config.yaml")
+    config = loadYaml(configYaml)
 
     # Loop through each repo in the config.yaml
     for repo in config:
@@ -895,16 +909,15 @@ def main():
 
         if "github_ref" in repo:
             logging.info("Cloning: %s", repo["repo_name"])
-            repo_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp/" + repo["repo_name"]) # Path to clone repo to
-            if os.path.exists(repo_path): # If path exists, remove and re-clone
+            repo_path = os.path.join(_TMP_BASE, repo["repo_name"]) # Path to clone repo to
+            if os.path.isdir(repo_path): # If path exists, remove and re-clone
                 shutil.rmtree(repo_path)
             repository = Repo.clone_from(repo["github_ref"], repo_path) # Clone repo to above path
             if 'branch' in repo:
                 repository.git.checkout(repo['branch']) # If a branch is specified, checkout that branch
             sizesyaml = repo_path + "/bundle/manifests/sizes.yaml"
             if os.path.isfile(sizesyaml):
-                with open(sizesyaml, 'r') as f:
-                    sizes = yaml.safe_load(f)
+                sizes = loadYaml(sizesyaml)
             else:
                 sizes = {}
 
@@ -940,8 +953,7 @@ def main():
             repo["operators"] = [op]
             sizesyaml = bundlePath + "/sizes.yaml"
             if os.path.isfile(sizesyaml):
-                with open(sizesyaml, 'r') as f:
-                    sizes = yaml.safe_load(f)
+                sizes = loadYaml(sizesyaml)
             else:
                 sizes = {}
 
@@ -1028,13 +1040,13 @@ def main():
 
             if not skipOverrides:
                 logging.info("Adding Overrides to helm chart '%s' (set --skipOverrides=true to skip) ...", operator["name"])
-                exclusions = operator["exclusions"] if "exclusions" in operator else []
+                exclusions = frozenset(operator.get("exclusions") or ())
                 injectRequirements(helmChart, operator, exclusions, sizes, branch)
                 logging.info("Overrides added to helm chart '%s' successfully.", operator["name"])
 
     logging.info("All repositories and operators processed successfully.")
     logging.info("Performing cleanup...")
-    shutil.rmtree((os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp")), ignore_errors=True)
+    shutil.rmtree(_TMP_BASE, ignore_errors=True)
 
     logging.info("Cleanup completed.")
     logging.info("Script execution completed.")
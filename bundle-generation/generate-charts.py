@@ -4,6 +4,12 @@
 # Assumes: Python 3.6+
 
 import argparse
+import concurrent.futures
+import copy
+import functools
+import hashlib
+import json
+import multiprocessing
 import os
 import shutil
 import yaml
@@ -19,31 +25,103 @@ from validate_csv import *
 # Configure logging with coloredlogs
 coloredlogs.install(level='DEBUG')  # Set the logging level as needed
 
+# Path of this script, its directory, and the directory the source repos are cloned into
+_SCRIPT_PATH = os.path.realpath(__file__)
+_SCRIPT_DIR = os.path.dirname(_SCRIPT_PATH)
+_TMP_BASE = os.path.join(_SCRIPT_DIR, "tmp")
+
+# Parse and emit with libyaml when PyYAML was built against it, falling back to the pure-Python classes
+try:
+    from yaml import CSafeLoader as _SafeLoader, CSafeDumper as _SafeDumper
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader, SafeDumper as _SafeDumper
+
+# SafeLoader that builds mappings in one step. The stock constructor is a generator so that it can
+# resolve recursive anchors, which Kubernetes manifests don't use.
+class TemplateLoader(_SafeLoader):
+    def construct_plain_map(self, node):
+        return self.construct_mapping(node)
+
+TemplateLoader.add_constructor('tag:yaml.org,2002:map', TemplateLoader.construct_plain_map)
+
+# Dumper that never emits anchors/aliases, so shared objects are written out in full and the
+# representer skips tracking every node it has already seen.
+class TemplateDumper(_SafeDumper):
+    def ignore_aliases(self, data):
+        return True
+
+# Parsed template documents keyed by absolute path. Each entry remembers the file's
+# (mtime, size) at parse time so edits made outside loadTemplate/saveTemplate are noticed.
+_YAML_CACHE = {}
+
+def _fileStamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+# Return the parsed YAML document at path, reusing the previous parse if the file is unchanged.
+# Callers may mutate the returned document, but must persist it with saveTemplate.
+def loadTemplate(path):
+    path = os.path.abspath(path)
+    cached = _YAML_CACHE.get(path)
+    if cached is not None and cached[0] == _fileStamp(path):
+        return cached[1]
+    with open(path, 'rb') as f:
+        doc = yaml.load(f, Loader=TemplateLoader)
+    _YAML_CACHE[path] = (_fileStamp(path), doc)
+    return doc
+
+# Effectively unbounded line width for yaml.dump, so long Helm expressions are never folded.
+# An int keeps the emitter's column checks on integers (float("inf") renders the same output).
+_DUMP_WIDTH = 2**31 - 1
+
+# Write doc to path and keep it cached as the current parse of that file. Files are compared and
+# written as bytes, so the existing content is never decoded.
+# The file is left untouched when its serialized content hasn't changed.
+def saveTemplate(path, doc):
+    path = os.path.abspath(path)
+    content = yaml.dump(doc, Dumper=TemplateDumper, width=_DUMP_WIDTH).encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            unchanged = f.read() == content
+    except FileNotFoundError:
+        unchanged = False
+    if not unchanged:
+        with open(path, 'wb') as f:
+            f.write(content)
+    _YAML_CACHE[path] = (_fileStamp(path), doc)
+
+# Drop the cached parse of path. Must be called after rewriting a template as plain text,
+# since two writes within the same timestamp tick can leave (mtime, size) unchanged.
+def invalidateTemplate(path):
+    _YAML_CACHE.pop(os.path.abspath(path), None)
+
+# Helm template fragments substituted into the chart templates
+_NAMESPACE_REF = '{{ .Values.global.namespace }}'
+_PULL_POLICY_REF = "{{ .Values.global.pullPolicy }}"
+_RBAC_NAME_PREFIX = "{{ .Values.org }}:{{ .Chart.Name }}:"
+
+# Resource kinds that get the standard RBAC name prefix, and those of them that also reference a role
+_RBAC_KINDS = frozenset({'ClusterRole', 'Role', 'ClusterRoleBinding', 'RoleBinding'})
+_RBAC_BINDING_KINDS = frozenset({'RoleBinding', 'ClusterRoleBinding'})
+
+# Helm reference to the override of the given image-key in values.yaml. Charts reuse a handful
+# of image-keys across all of their containers, so the fragments are built once and shared.
+@functools.lru_cache(maxsize=None)
+def imageOverrideRef(imageKey):
+    return "{{ .Values.global.imageOverrides." + imageKey + " }}"
+
+# Image ref:  [registry-and-ns/]repository-name[:tag][@digest]
+_IMAGE_REF_RE = re.compile(r'^(?:(?P<registry_and_namespace>.+)/)?(?P<repository>[^/:@]+)(?::(?P<tag>[^/:@]+))?(?:@(?P<digest>.+))?$')
+
 # Parse an image reference, return dict containing image reference information
 def parse_image_ref(image_ref):
-   # Image ref:  [registry-and-ns/]repository-name[:tag][@digest]
-   parsed_ref = dict()
-
-   remaining_ref = image_ref
-   at_pos = remaining_ref.rfind("@")
-   if at_pos > 0:
-      parsed_ref["digest"] = remaining_ref[at_pos+1:]
-      remaining_ref = remaining_ref[0:at_pos]
-   else:
-      parsed_ref["digest"] = None
-   colon_pos = remaining_ref.rfind(":")
-   if colon_pos > 0:
-      parsed_ref["tag"] = remaining_ref[colon_pos+1:]
-      remaining_ref = remaining_ref[0:colon_pos]
+   match = _IMAGE_REF_RE.match(image_ref)
+   if match:
+      parsed_ref = match.groupdict()
    else:
-      parsed_ref["tag"] = None
-   slash_pos = remaining_ref.rfind("/")
-   if slash_pos > 0:
-      parsed_ref["repository"] = remaining_ref[slash_pos+1:]
-      rgy_and_ns = remaining_ref[0:slash_pos]
-   else:
-      parsed_ref["repository"] = remaining_ref
-      rgy_and_ns = "localhost"
+      parsed_ref = {"registry_and_namespace": None, "repository": image_ref, "tag": None, "digest": None}
+
+   rgy_and_ns = parsed_ref["registry_and_namespace"] or "localhost"
    parsed_ref["registry_and_namespace"] = rgy_and_ns
 
    rgy, ns = split_at(rgy_and_ns, "/", favor_right=False)
@@ -62,9 +140,15 @@ def parse_image_ref(image_ref):
 
    return parsed_ref
 
+# Repository name of an image reference, which is what `imageMappings` is keyed by. The same images
+# are referenced from many containers and env vars, so each reference is only parsed once.
+@functools.lru_cache(maxsize=None)
+def imageRepository(imageRef):
+    return parse_image_ref(imageRef)["repository"]
+
 
 def updateAddOnDeploymentConfig(yamlContent):
-    yamlContent['metadata']['namespace'] = '{{ .Values.global.namespace }}'
+    yamlContent['metadata']['namespace'] = _NAMESPACE_REF
 
 
 def updateClusterManagementAddOn(yamlContent):
@@ -79,7 +163,7 @@ def updateClusterManagementAddOn(yamlContent):
         defaultConfig = config['defaultConfig']
         if 'namespace' not in defaultConfig:
             continue
-        defaultConfig['namespace'] = '{{ .Values.global.namespace }}'
+        defaultConfig['namespace'] = _NAMESPACE_REF
 
 # installAddonForAllClusters updates the clusterManagementAddOn to add a installStrategy
 # to install the addon for all clusters
@@ -109,31 +193,93 @@ def installAddonForAllClusters(yamlContent):
 def updateServiceAccount(yamlContent):
     yamlContent['metadata'].pop('namespace')
 
+# Point every subject of a ClusterRoleBinding at the release namespace, returning how many were updated
 def updateClusterRoleBinding(yamlContent):
-    subjectsList = yamlContent['subjects']
+    subjectsList = yamlContent.get('subjects') or ()
     for sub in subjectsList:
-        sub['namespace'] = '{{ .Values.global.namespace }}'
+        sub['namespace'] = _NAMESPACE_REF
+    return len(subjectsList)
 
+# Escape the given {{VARIABLE}} placeholders in a chart's AddOnTemplates so helm leaves them for the addon
+# framework to substitute. All variables are matched by one pattern, so each template is scanned once.
 def escapeTemplateVariables(helmChart, variables):
+    if not variables:
+        logging.info("No template variables to escape.\n")
+        return
+    logging.info("Start to escape variables %s", ", ".join(variables))
+    pattern = re.compile(b"|".join(re.escape(("{{" + variable + "}}").encode('utf-8')) for variable in variables))
+
     addonTemplates = findTemplatesOfType(helmChart, 'AddOnTemplate')
     for addonTemplate in addonTemplates:
-        for variable in variables:
-            logging.info("Start to escape vriable %s", variable)
-            at = open(addonTemplate, "r")
-            lines = at.readlines()
-            v = "{{"+variable+"}}"
-            for i, line in enumerate(lines):
-                if v in line.strip():
-                    logging.info("Found variable %s in line: %s", v, line.strip())
-                    lines[i] = line.replace(v, "{{ `"+ v + "` }}")
-
-            a_file = open(addonTemplate, "w")
-            a_file.writelines(lines)
-            a_file.close()
+        with open(addonTemplate, "rb") as at:
+            content = at.read()
+        content, escaped = pattern.subn(lambda m: b"{{ `" + m.group(0) + b"` }}", content)
+        if escaped:
+            logging.debug("Escaped %d template variable(s) in %s", escaped, addonTemplate)
+            with open(addonTemplate, "wb") as a_file:
+                a_file.write(content)
+            invalidateTemplate(addonTemplate)
     logging.info("Escaped template variables.\n")
 
-# Copy chart-templates to a new helmchart directory
-def updateResources(outputDir, repo, chart):
+def _updateAddOnDeploymentConfigResource(yamlContent, chart, filePath):
+    logging.info("Updating AddOnDeploymentConfig in %s", filePath)
+    updateAddOnDeploymentConfig(yamlContent)
+
+def _updateClusterManagementAddOnResource(yamlContent, chart, filePath):
+    logging.info("Updating ClusterManagementAddOn in %s", filePath)
+    updateClusterManagementAddOn(yamlContent)
+    if chart.get('auto-install-for-all-clusters', False):
+        installAddonForAllClusters(yamlContent)
+
+def _updateServiceAccountResource(yamlContent, chart, filePath):
+    logging.info("Updating ServiceAccount in %s", filePath)
+    updateServiceAccount(yamlContent)
+
+def _updateClusterRoleBindingResource(yamlContent, chart, filePath):
+    skip_rbac_override = chart.get('skipRBACOverrides', False)
+    if not skip_rbac_override:
+        updated = updateClusterRoleBinding(yamlContent)
+        logging.info("Updated namespace of %s ClusterRoleBinding subject(s) in %s", updated, filePath)
+    else:
+        logging.warning("Skipping ClusterRoleBinding update (RBAC override is disabled) in %s", filePath)
+
+# Resource updaters applied by updateResources, keyed by resource kind. Each updater
+# takes the parsed resource, the chart configuration and the template path.
+_RESOURCE_UPDATERS = {
+    "AddOnDeploymentConfig": _updateAddOnDeploymentConfigResource,
+    "ClusterManagementAddOn": _updateClusterManagementAddOnResource,
+    "ServiceAccount": _updateServiceAccountResource,
+    "ClusterRoleBinding": _updateClusterRoleBindingResource,
+}
+
+# Apply the kind-specific updater to a single template file. This runs in a worker process,
+# so failures are returned as an error message (None on success) instead of aborting the caller.
+def _updateResourceTemplate(filePath, chart):
+    try:
+        yamlContent = loadTemplate(filePath)
+    except Exception as e:
+        return f"Error reading YAML content from {filePath}: {e}"
+
+    # Log the kind of resource being processed   
+    kind = yamlContent.get("kind")
+    logging.debug("Found resource of kind: %s in %s", kind, filePath)
+
+    # Perform the appropriate update action based on the kind
+    updater = _RESOURCE_UPDATERS.get(kind)
+    if updater is None:
+        logging.warning("Skipping unsupported kind '%s' in %s. No updates applied", kind, filePath)
+        return None # Skip unsupported kinds
+    updater(yamlContent, chart, filePath)
+
+    try:
+        saveTemplate(filePath, yamlContent)
+        logging.debug("Successfully updated %s", filePath)
+    except Exception as e:
+        return f"Error writing YAML content to {filePath}: {e}"
+    return None
+
+# Copy chart-templates to a new helmchart directory. Returns False if any resource could not be updated.
+def updateResources(outputDir, repo, chart, parallel=True):
     logging.info("Starting resource update process ...")
 
     # Create main folder
@@ -141,116 +287,99 @@ def updateResources(outputDir, repo, chart):
     chartDir = os.path.join(outputDir, "charts", always_or_toggle, chart['name'])
     templateDir = os.path.join(chartDir, "templates")
 
-    # Check if template directory exists
-    if not os.path.exists(templateDir):
-        logging.error(f"Template directory {templateDir} does not exist. Exiting update process.")
-        return # Exit early if the template directory doesn't exist
-
-    for tempFile in os.listdir(templateDir):
-        filePath = os.path.join(templateDir, tempFile)
-
-        try:
-            with open(filePath, 'r') as f:
-                yamlContent = yaml.safe_load(f)
-        except Exception as e:
-            logging.error(f"Error reading YAML content from {filePath}: {e}")
-            return
-
-        # Log the kind of resource being processed   
-        kind = yamlContent.get("kind")
-        logging.info(f"Found resource of kind: {kind} in {filePath}")
-
-        # Perform the appropriate update action based on the kind
-        if kind == "AddOnDeploymentConfig":
-            logging.info(f"Updating AddOnDeploymentConfig in {filePath}")
-            updateAddOnDeploymentConfig(yamlContent)
-
-        elif kind == "ClusterManagementAddOn":
-            logging.info(f"Updating ClusterManagementAddOn in {filePath}")
-            updateClusterManagementAddOn(yamlContent)
-            if chart.get('auto-install-for-all-clusters', False):
-                installAddonForAllClusters(yamlContent)
-
-        elif kind == "ServiceAccount":
-            logging.info(f"Updating ServiceAccount in {filePath}")
-            updateServiceAccount(yamlContent)
-
-        elif kind == "ClusterRoleBinding":
-            skip_rbac_override = chart.get('skipRBACOverrides', False)
-            if not skip_rbac_override:
-                logging.info(f"Updating ClusterRoleBinding in {filePath}")
-                updateClusterRoleBinding(yamlContent)
-            else:
-                logging.warning(f"Skipping ClusterRoleBinding update (RBAC override is disabled) in {filePath}")
-
-        else:
-            logging.warning(f"Skipping unsupported kind '{kind}' in {filePath}. No updates applied")
-            continue # Skip unsupported kinds
+    # List the templates, checking that the template directory exists
+    try:
+        with os.scandir(templateDir) as it:
+            templates = [entry.path for entry in it]
+    except FileNotFoundError:
+        logging.error("Template directory %s does not exist. Exiting update process.", templateDir)
+        return False # Exit early if the template directory doesn't exist
+
+    # Templates are independent of each other, so parse/update/dump them in parallel unless the caller
+    # is already running in parallel. Daemonic processes can't start children of their own, so fall
+    # back to a serial pass inside one.
+    if parallel and len(templates) > 1 and not multiprocessing.current_process().daemon:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(len(templates), os.cpu_count() or 1)) as executor:
+            errors = list(executor.map(_updateResourceTemplate, templates, [chart] * len(templates)))
+        # The workers rewrote these files, so any parse cached by this process is stale
+        for filePath in templates:
+            invalidateTemplate(filePath)
+    else:
+        errors = [_updateResourceTemplate(filePath, chart) for filePath in templates]
 
-        try:
-            with open(filePath, 'w') as f:
-                yaml.dump(yamlContent, f, width=float("inf"))
-            logging.info(f"Successfully updated {filePath}")
-        except Exception as e:
-            logging.error(f"Error writing YAML content to {filePath}: {e}")
-            return
+    errors = [error for error in errors if error]
+    if errors:
+        for error in errors:
+            logging.error(error)
+        return False
+    logging.info("Processed %d templates in %s", len(templates), templateDir)
 
     try:
         # Escape template variables
         escapeTemplateVariables(chartDir, chart["escape-template-variables"])
-        logging.info(f"Template variables escaped successfully for {chartDir}.")
+        logging.info("Template variables escaped successfully for %s.", chartDir)
     except Exception as e:
-        logging.error(f"Error escaping template variables in {chartDir}: {e}")
-        return
+        logging.error("Error escaping template variables in %s: %s", chartDir, e)
+        return False
 
     logging.info("All resources updated successfully.")
+    return True
 
 
-# Copy chart-templates to a new helmchart directory
+# Copy chart-templates to a new helmchart directory. Returns False if the chart could not be fully generated.
 def copyHelmChart(destinationChartPath, repo, chart, chartVersion):
     chartName = chart.get('name', '')
-    logging.info(f"Starting to process chart '{chartName}' chart directory")
+    logging.info("Starting to process chart '%s' chart directory", chartName)
 
     # Create main folder
-    chartPath = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, chart["chart-path"])
-    logging.debug(f"Chart path resolved to: '{chartPath}'")
-    logging.debug(f"Destination chart path: '{destinationChartPath}'")
+    chartPath = os.path.join(_TMP_BASE, repo, chart["chart-path"])
+    logging.debug("Chart path resolved to: '%s'", chartPath)
+    logging.debug("Destination chart path: '%s'", destinationChartPath)
 
-    if os.path.exists(destinationChartPath):
-        logging.warning(f"Destination chart path already exists. Removing: {destinationChartPath}")
+    try:
         shutil.rmtree(destinationChartPath)
+        logging.warning("Destination chart path already existed and was removed: %s", destinationChartPath)
+    except FileNotFoundError:
+        pass
     
     # Copy Chart.yaml, values.yaml, and templates dir
     destinationTemplateDir = os.path.join(destinationChartPath, "templates")
-    logging.info(f"Creating destination template directory: {destinationTemplateDir}")
-    os.makedirs(destinationTemplateDir)
+    logging.info("Creating destination template directory: %s", destinationTemplateDir)
+    os.makedirs(destinationTemplateDir, exist_ok=True)
 
     chartYamlPath = os.path.join(chartPath, "Chart.yaml")
-    if not os.path.exists(chartYamlPath):
-        logging.error(f"Missing Chart.yaml in chart: '{chartName}' at path: {chartYamlPath}")
-        return
+    if not os.path.isfile(chartYamlPath):
+        logging.error("Missing Chart.yaml in chart: '%s' at path: %s", chartName, chartYamlPath)
+        return False
 
     # Update chart version if specified before rendering templates
     if chartVersion != "":
         with open(chartYamlPath, 'r') as f:
-            chartYaml = yaml.safe_load(f)
-        chartYaml['version'] = chartVersion
-        with open(chartYamlPath, 'w') as f:
-            yaml.dump(chartYaml, f, width=float("inf"))
-
-    specificValues = os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-values", chart['name'], "values.yaml")
-    if os.path.exists(specificValues):
-        logging.info(f"Using specific values.yaml for chart '{chartName}' from: {specificValues}")
+            chartYaml = yaml.load(f, Loader=_SafeLoader)
+        if chartYaml.get('version') != chartVersion:
+            chartYaml['version'] = chartVersion
+            with open(chartYamlPath, 'w') as f:
+                yaml.dump(chartYaml, f, Dumper=_SafeDumper, width=_DUMP_WIDTH)
+
+    specificValues = os.path.join(_SCRIPT_DIR, "chart-values", chart['name'], "values.yaml")
+    if os.path.isfile(specificValues):
+        logging.info("Using specific values.yaml for chart '%s' from: %s", chartName, specificValues)
         shutil.copyfile(specificValues, os.path.join(chartPath, "values.yaml"))
     else:
-        logging.warning(f"No specific values.yaml found for chart '{chartName}'")
+        logging.warning("No specific values.yaml found for chart '%s'", chartName)
 
-    logging.info(f"Running 'helm template' for chart: '{chartName}'")
-    helmTemplateOutput = subprocess.getoutput(['helm template '+ chartPath])
+    logging.info("Running 'helm template' for chart: '%s'", chartName)
+    # Run helm directly rather than through a shell, and keep its stderr out of the rendered YAML
+    helmTemplate = subprocess.run(['helm', 'template', chartPath], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  universal_newlines=True)
+    succeeded = helmTemplate.returncode == 0
+    if not succeeded:
+        logging.error("'helm template' failed for chart '%s': %s", chartName, helmTemplate.stderr.strip())
+    helmTemplateOutput = helmTemplate.stdout
 
     yamlList = helmTemplateOutput.split('---')
     for outputContent in yamlList:
-        yamlContent = yaml.safe_load(outputContent)
+        yamlContent = yaml.load(outputContent, Loader=_SafeLoader)
         if yamlContent is None:
             logging.warning("Skipped empty or invalid YAML content during template processing")
             continue
@@ -264,141 +393,105 @@ def copyHelmChart(destinationChartPath, repo, chart, chartVersion):
         yamlFileName = f"{name}-{kind}" if name else kind
         newFileName = yamlFileName + '.yaml'
         newFilePath= os.path.join(destinationTemplateDir, newFileName)
-        logging.info(f"Generated file: '{newFileName}'")
+        logging.info("Generated file: '%s'", newFileName)
 
         try:
             with open(newFilePath, "w") as f:
-                f.writelines(outputContent)
+                f.write(outputContent)
+            invalidateTemplate(newFilePath)
 
         except Exception as e:
-            logging.error(f"Failed to write file '{newFilePath}': {e}")
+            logging.error("Failed to write file '%s': %s", newFilePath, e)
+            succeeded = False
 
     shutil.copyfile(chartYamlPath, os.path.join(destinationChartPath, "Chart.yaml"))
     shutil.copyfile(os.path.join(chartPath, "values.yaml"), os.path.join(destinationChartPath, "values.yaml"))
 
     # Copying template values.yaml instead of values.yaml from chart
-    shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates", "values.yaml"), os.path.join(destinationChartPath, "values.yaml"))
+    shutil.copyfile(os.path.join(_SCRIPT_DIR, "chart-templates", "values.yaml"), os.path.join(destinationChartPath, "values.yaml"))
+
+    logging.info("Finished processing chart: '%s'\n", chartName)
+    return succeeded
+
+_KIND_LINE_RE = re.compile(r'^kind:\s*["\']?([\w.-]+)', re.MULTILINE)
+
+# Return the resource kind of a YAML file from its top-level `kind:` line, which is looked for in the
+# complete lines of the first few KB only. Files without one there fall back to a full parse.
+def readKind(filePath):
+    with open(filePath, 'r') as f:
+        head = f.read(4096)
+    if len(head) == 4096:
+        # Drop the last, possibly cut off, line so a kind split at the boundary isn't read partially
+        head = head[:head.rfind('\n') + 1]
+    match = _KIND_LINE_RE.search(head)
+    if match:
+        return match.group(1)
+    return loadTemplate(filePath)['kind']
 
-    logging.info(f"Finished processing chart: '{chartName}'\n")
+# Return the paths of the YAML templates in a chart's templates directory
+def listTemplates(helmChart):
+    with os.scandir(os.path.join(helmChart, "templates")) as it:
+        return [entry.path for entry in it if entry.name.endswith((".yaml", ".yml"))]
 
 # Given a resource Kind, return all filepaths of that resource type in a chart directory
 def findTemplatesOfType(helmChart, kind):
-    resources = []
-    for filename in os.listdir(os.path.join(helmChart, "templates")):
-        if filename.endswith(".yaml") or filename.endswith(".yml"):
-            filePath = os.path.join(helmChart, "templates", filename)
-            with open(filePath, 'r') as f:
-                fileYml = yaml.safe_load(f)
-            if fileYml['kind'] == kind:
-                resources.append(filePath)
-            continue
-        else:
-            continue
-    return resources
-
-# For each deployment, identify the image references if any exist in the environment variable fields, insert helm flow control code to reference it, and add image-key to the values.yaml file.
-# If the image-key referenced in the deployment does not exist in `imageMappings` in the Config.yaml, this will fail. Images must be explicitly defined
-def fixEnvVarImageReferences(helmChart, imageKeyMapping):
-    logging.info("Fixing image references in container 'env' section in deployments and values.yaml ...")
-    
-    # Path to the values.yaml file
-    valuesYaml = os.path.join(helmChart, "values.yaml")
+    return [filePath for filePath in listTemplates(helmChart) if readKind(filePath) == kind]
 
-    # Check if the values.yaml file exists
-    if not os.path.exists(valuesYaml):
-        logging.error(f"{valuesYaml} does not exist. Skipping environment variable image reference updates.")
-        return
+# Given a chart directory, yield (path, kind, document) once for every YAML template in it
+def walkChart(helmChart):
+    for filePath in listTemplates(helmChart):
+        fileYml = loadTemplate(filePath)
+        yield filePath, fileYml['kind'], fileYml
 
-    with open(valuesYaml, 'r') as f:
-        values = yaml.safe_load(f)
-    deployments = findTemplatesOfType(helmChart, 'Deployment')
-
-    imageKeys = []
-    for deployment in deployments:
-        with open(deployment, 'r') as f:
-            deploy = yaml.safe_load(f)
-        
-        containers = deploy['spec']['template']['spec']['containers']
-        for container in containers:
-            if 'env' not in container: 
-                continue
-            
-            for env in container['env']:
-                image_key = env['name']
-                if image_key.endswith('_IMAGE') == False:
-                    continue
-                image_key = parse_image_ref(env['value'])['repository']
-                try:
-                    image_key = imageKeyMapping[image_key]
-                except KeyError:
-                    logging.critical("No image key mapping provided for imageKey: %s" % image_key)
-                    exit(1)
-                imageKeys.append(image_key)
-                env['value'] = "{{ .Values.global.imageOverrides." + image_key + " }}"
-        with open(deployment, 'w') as f:
-            yaml.dump(deploy, f, width=float("inf"))
-
-    for imageKey in imageKeys:
-        values['global']['imageOverrides'][imageKey] = ""
-    with open(valuesYaml, 'w') as f:
-        yaml.dump(values, f, width=float("inf"))
-    logging.info("Image container env references in deployments and values.yaml updated successfully.\n")
-
-# For each deployment, identify the image references if any exist in the image field, insert helm flow control code to reference it, and add image-key to the values.yaml file.
+# For a deployment, identify the image references if any exist in the environment variable fields and insert helm flow control code to reference them.
+# Returns the image-keys referenced so they can be added to the values.yaml file.
 # If the image-key referenced in the deployment does not exist in `imageMappings` in the Config.yaml, this will fail. Images must be explicitly defined
-def fixImageReferences(helmChart, imageKeyMapping):
-    logging.info("Fixing image and pull policy references in deployments and values.yaml ...")
-
-    # Path to the values.yaml file
-    valuesYaml = os.path.join(helmChart, "values.yaml")
-
-    # Check if the values.yaml file exists
-    if not os.path.exists(valuesYaml):
-        logging.error(f"{valuesYaml} does not exist. Skipping image and pull policy updates.")
-        return  # Exit the function if the file doesn't exist
-
-    with open(valuesYaml, 'r') as f:
-        values = yaml.safe_load(f)
-    
-    deployments = findTemplatesOfType(helmChart, 'Deployment')
+def fixEnvVarImageReferences(deploy, imageKeyMapping):
     imageKeys = []
-    temp = "" ## temporarily read image ref
-    for deployment in deployments:
-        with open(deployment, 'r') as f:
-            deploy = yaml.safe_load(f)
+    containers = deploy['spec']['template']['spec']['containers']
+    for container in containers:
+        if 'env' not in container: 
+            continue
         
-        containers = deploy['spec']['template']['spec']['containers']
-        for container in containers:
-            image_key = parse_image_ref(container['image'])["repository"]
+        for env in container['env']:
+            image_key = env['name']
+            if image_key.endswith('_IMAGE') == False:
+                continue
+            image_key = imageRepository(env['value'])
             try:
                 image_key = imageKeyMapping[image_key]
             except KeyError:
                 logging.critical("No image key mapping provided for imageKey: %s" % image_key)
                 exit(1)
             imageKeys.append(image_key)
-            # temp = container['image'] 
-            container['image'] = "{{ .Values.global.imageOverrides." + image_key + " }}"
-            container['imagePullPolicy'] = "{{ .Values.global.pullPolicy }}"
-            args = container['args']
-            refreshed_args = []
-            for arg in args:
-                if "--agent-image-name" not in arg:
-                    refreshed_args.append(arg)
-                else:
-                    refreshed_args.append("--agent-image-name="+"{{ .Values.global.imageOverrides." + image_key + " }}")
-            container['args'] = refreshed_args
-        with open(deployment, 'w') as f:
-            yaml.dump(deploy, f, width=float("inf"))
-
-    if 'imageOverride' in values['global']['imageOverrides']:
-        del values['global']['imageOverrides']['imageOverride']
-
-    for imageKey in imageKeys:
-        values['global']['imageOverrides'][imageKey] = "" # set to temp to debug
-
-    with open(valuesYaml, 'w') as f:
-        yaml.dump(values, f, width=float("inf"))
-    logging.info("Image references and pull policy in deployments and values.yaml updated successfully.\n")
+            env['value'] = imageOverrideRef(image_key)
+    return imageKeys
+
+# For a deployment, identify the image references if any exist in the image field and insert helm flow control code to reference them.
+# Returns the image-keys referenced so they can be added to the values.yaml file.
+# If the image-key referenced in the deployment does not exist in `imageMappings` in the Config.yaml, this will fail. Images must be explicitly defined
+def fixImageReferences(deploy, imageKeyMapping):
+    imageKeys = []
+    containers = deploy['spec']['template']['spec']['containers']
+    for container in containers:
+        image_key = imageRepository(container['image'])
+        try:
+            image_key = imageKeyMapping[image_key]
+        except KeyError:
+            logging.critical("No image key mapping provided for imageKey: %s" % image_key)
+            exit(1)
+        imageKeys.append(image_key)
+        container['image'] = imageOverrideRef(image_key)
+        container['imagePullPolicy'] = _PULL_POLICY_REF
+        args = container['args']
+        refreshed_args = []
+        for arg in args:
+            if "--agent-image-name" not in arg:
+                refreshed_args.append(arg)
+            else:
+                refreshed_args.append("--agent-image-name=" + imageOverrideRef(image_key))
+        container['args'] = refreshed_args
+    return imageKeys
 
 # insers Heml flow control if/end block around a first and last line without changing
 # the indexes of the lines list (so as to not mess up iteration across the lines).
@@ -406,32 +499,41 @@ def insertFlowControlIfAround(lines_list, first_line_index, last_line_index, if_
    lines_list[first_line_index] = "{{- if %s }}\n%s" % (if_condition, lines_list[first_line_index])
    lines_list[last_line_index] = "%s{{- end }}\n" % lines_list[last_line_index]
 
+# Extract the version part from the branch name (e.g., '2.12-integration' -> '2.12').
+# Compiled once since is_version_compatible is evaluated for every line of every deployment.
+_BRANCH_VERSION_RE = re.compile(r'(\d+\.\d+)')  # Matches versions like '2.12'
+
+# Parse a version string, reusing the Version object for versions parsed before
+@functools.lru_cache(maxsize=None)
+def parseVersion(v):
+    return version.Version(v)
+
+# The result depends only on the arguments, and every deployment of a chart asks the same questions
+# about the same branch, so answers are cached.
+@functools.lru_cache(maxsize=None)
 def is_version_compatible(branch, min_release_version, min_backplane_version, min_ocm_version, enforce_master_check=True):
-    # Extract the version part from the branch name (e.g., '2.12-integration' -> '2.12')
-    pattern = r'(\d+\.\d+)'  # Matches versions like '2.12'
-    
     if branch == "main" or branch == "master":
         if enforce_master_check:
             return True
         else:
             return False
     
-    match = re.search(pattern, branch)
+    match = _BRANCH_VERSION_RE.search(branch)
     if match:
         v = match.group(1)  # Extract the version
-        branch_version = version.Version(v)  # Create a Version object
+        branch_version = parseVersion(v)  # Create a Version object
         
         if "release-ocm" in branch:
-            min_branch_version = version.Version(min_ocm_version)  # Use the minimum release version
+            min_branch_version = parseVersion(min_ocm_version)  # Use the minimum release version
         
         elif "release" in branch:
-            min_branch_version = version.Version(min_release_version)  # Use the minimum release version
+            min_branch_version = parseVersion(min_release_version)  # Use the minimum release version
 
         elif "backplane" in branch or "mce" in branch:
-            min_branch_version = version.Version(min_backplane_version)  # Use the minimum backplane version
+            min_branch_version = parseVersion(min_backplane_version)  # Use the minimum backplane version
 
         else:
-            logging.error(f"Unrecognized branch type for branch: {branch}")
+            logging.error("Unrecognized branch type for branch: %s", branch)
             return False
 
         # Check if the branch version is compatible with the specified minimum branch
@@ -441,10 +543,15 @@ def is_version_compatible(branch, min_release_version, min_backplane_version, mi
         return False
 
 # injectHelmFlowControl injects advanced helm flow control which would typically make a .yaml file more difficult to parse. This should be called last.
-def injectHelmFlowControl(deployment, branch):
+# With pullSecretOverride, the containers' env also gets the image pull secret ahead of the proxy settings.
+def injectHelmFlowControl(deployment, branch, pullSecretOverride=False):
     logging.info("Adding Helm flow control for NodeSelector, Proxy Overrides, and SeccompProfile ...")
-    deploy = open(deployment, "r")
-    lines = deploy.readlines()
+    with open(deployment, "r") as deploy:
+        original = deploy.read()
+    lines = original.splitlines(keepends=True)
+    # Both checks depend only on the branch, so evaluate them once rather than per line
+    replicaCountSupported = is_version_compatible(branch, '9.9', '9.9', '9.9', False)
+    deployOnOCPSupported = is_version_compatible(branch, '9.9', '2.7', '2.12')
     for i, line in enumerate(lines):
         if line.strip() == "nodeSelector: \'\'":
             lines[i] = """{{- with .Values.hubconfig.nodeSelector }}
@@ -474,7 +581,15 @@ def injectHelmFlowControl(deployment, branch):
 
         if line.strip() == "env:" or line.strip() == "env: {}":
             lines[i] = """        env:
-{{- if .Values.hubconfig.proxyConfigs }}
+"""
+            if pullSecretOverride:
+                logging.info("Adding image pull secret environment variable to managed-serviceaccount deployment")
+                lines[i] += """{{- if .Values.global.pullSecret }}
+        - name: AGENT_IMAGE_PULL_SECRET
+          value: {{ .Values.global.pullSecret }}
+{{- end }}
+"""
+            lines[i] += """{{- if .Values.hubconfig.proxyConfigs }}
         - name: HTTP_PROXY
           value: {{ .Values.hubconfig.proxyConfigs.HTTP_PROXY }}
         - name: HTTPS_PROXY
@@ -484,7 +599,7 @@ def injectHelmFlowControl(deployment, branch):
 {{- end }}
 """
 
-        if is_version_compatible(branch, '9.9', '9.9', '9.9', False):
+        if replicaCountSupported:
             if 'replicas:' in line.strip():
                 lines[i] = """  replicas: {{ .Values.hubconfig.replicaCount }}
 """
@@ -494,209 +609,164 @@ def injectHelmFlowControl(deployment, branch):
             prev_line = lines[i-1]
             if next_line.strip() == "type: RuntimeDefault" and "semverCompare" not in prev_line:
                 insertFlowControlIfAround(lines, i, i+1, "semverCompare \">=4.11.0\" .Values.hubconfig.ocpVersion")
-                if is_version_compatible(branch, '9.9', '2.7', '2.12'):
+                if deployOnOCPSupported:
                     insertFlowControlIfAround(lines, i, i+1, ".Values.global.deployOnOCP")
 
-        a_file = open(deployment, "w")
-        a_file.writelines(lines)
-        a_file.close()
+    content = "".join(lines)
+    if content != original:
+        with open(deployment, "w") as a_file:
+            a_file.write(content)
+        invalidateTemplate(deployment)
     logging.info("Added Helm flow control for NodeSelector, Proxy, and SeccompProfile Overrides.\n")
 
-def addPullSecretOverride(deployment):
-    deploy = open(deployment, "r")
-    lines = deploy.readlines()
-    for i, line in enumerate(lines):
-        if line.strip() == "env:" or line.strip() == "env: {}":
-            logging.info("Adding image pull secret environment variable to managed-serviceaccount deployment")
-            lines[i] = """        env:
-{{- if .Values.global.pullSecret }}
-        - name: AGENT_IMAGE_PULL_SECRET
-          value: {{ .Values.global.pullSecret }}
-{{- end }}
-"""
-        a_file = open(deployment, "w")
-        a_file.writelines(lines)
-        a_file.close()
-
-# updateDeployments adds standard configuration to the deployments (antiaffinity, security policies, and tolerations)
-def updateDeployments(chartName, helmChart, exclusions, inclusions, branch):
-    logging.info("Updating deployments with antiaffinity, security policies, and tolerations ...")
-    deploySpecYaml = os.path.join(os.path.dirname(os.path.realpath(__file__)), "chart-templates/templates/deploymentspec.yaml")
-    with open(deploySpecYaml, 'r') as f:
-        deploySpec = yaml.safe_load(f)
-    
-    deployments = findTemplatesOfType(helmChart, 'Deployment')
-    for deployment in deployments:
-        with open(deployment, 'r') as f:
-            deploy = yaml.safe_load(f)
-        deploy['metadata'].pop('namespace')
-        affinityList = deploySpec['affinity']['podAntiAffinity']['preferredDuringSchedulingIgnoredDuringExecution']
-        for antiaffinity in affinityList:
-            antiaffinity['podAffinityTerm']['labelSelector']['matchExpressions'][0]['values'][0] = deploy['metadata']['name']
-        deploy['spec']['template']['spec']['affinity'] = deploySpec['affinity']
-        deploy['spec']['template']['spec']['tolerations'] = ''
-        deploy['spec']['template']['spec']['hostNetwork'] = False
-        deploy['spec']['template']['spec']['hostPID'] = False
-        deploy['spec']['template']['spec']['hostIPC'] = False
-        if 'securityContext' not in deploy['spec']['template']['spec']:
-            deploy['spec']['template']['spec']['securityContext'] = {}
-        deploy['spec']['template']['spec']['securityContext']['runAsNonRoot'] = True
-        deploy['spec']['template']['metadata']['labels']['ocm-antiaffinity-selector'] = deploy['metadata']['name']
-        deploy['spec']['template']['spec']['nodeSelector'] = ""
-        deploy['spec']['template']['spec']['imagePullSecrets'] = ''
-        pod_template_spec = deploy['spec']['template']['spec']
-        if 'securityContext' not in pod_template_spec:
-            pod_template_spec['securityContext'] = {}
-        pod_security_context = pod_template_spec['securityContext']
-        pod_security_context['runAsNonRoot'] = True
-        if 'seccompProfile' not in pod_security_context:
-            pod_security_context['seccompProfile'] = {'type': 'RuntimeDefault'}
-            # This will be made conditional on OCP version >= 4.11 by injectHelmFlowControl()
-        else:
-            if pod_security_context['seccompProfile']['type'] != 'RuntimeDefault':
-                logging.warning("Leaving non-standard pod-level seccompprofile setting.")
-
-        containers = deploy['spec']['template']['spec']['containers']
-        for container in containers:
-            if 'securityContext' not in container: 
-                container['securityContext'] = {}
-            if 'env' not in container: 
-                container['env'] = {}
-            container['securityContext']['allowPrivilegeEscalation'] = False
-            container['securityContext']['capabilities'] = {}
-            container['securityContext']['capabilities']['drop'] = ['ALL']
-            container['securityContext']['privileged'] = False
-            container['securityContext']['runAsNonRoot'] = True
-            if 'readOnlyRootFilesystem' not in exclusions:
-                container['securityContext']['readOnlyRootFilesystem'] = True
-            if 'seccompProfile' in container['securityContext']:
-                if container['securityContext']['seccompProfile']['type'] == 'RuntimeDefault':
-                    # Remove, to allow pod-level setting to have effect.
-                    del container['securityContext']['seccompProfile']
-                else:
-                    container_name = container['name']
-                    logging.warning("Leaving non-standard seccompprofile setting for container %s" % container_name)
-        
-        with open(deployment, 'w') as f:
-            yaml.dump(deploy, f, width=float("inf"))
-        logging.info("Deployments updated with antiaffinity, security policies, and tolerations successfully. \n")
-
-        injectHelmFlowControl(deployment, branch)
-        if 'pullSecretOverride' in inclusions:
-            addPullSecretOverride(deployment)
+# updateDeployment adds standard configuration to a deployment (antiaffinity, security policies, and tolerations)
+def updateDeployment(deploy, deploySpec, exclusions):
+    deploy['metadata'].pop('namespace')
+    affinityList = deploySpec['affinity']['podAntiAffinity']['preferredDuringSchedulingIgnoredDuringExecution']
+    for antiaffinity in affinityList:
+        antiaffinity['podAffinityTerm']['labelSelector']['matchExpressions'][0]['values'][0] = deploy['metadata']['name']
+    # Copy so cached documents don't share (and later see changes to) the same affinity object
+    deploy['spec']['template']['spec']['affinity'] = copy.deepcopy(deploySpec['affinity'])
+    deploy['spec']['template']['spec']['tolerations'] = ''
+    deploy['spec']['template']['spec']['hostNetwork'] = False
+    deploy['spec']['template']['spec']['hostPID'] = False
+    deploy['spec']['template']['spec']['hostIPC'] = False
+    if 'securityContext' not in deploy['spec']['template']['spec']:
+        deploy['spec']['template']['spec']['securityContext'] = {}
+    deploy['spec']['template']['spec']['securityContext']['runAsNonRoot'] = True
+    deploy['spec']['template']['metadata']['labels']['ocm-antiaffinity-selector'] = deploy['metadata']['name']
+    deploy['spec']['template']['spec']['nodeSelector'] = ""
+    deploy['spec']['template']['spec']['imagePullSecrets'] = ''
+    pod_template_spec = deploy['spec']['template']['spec']
+    if 'securityContext' not in pod_template_spec:
+        pod_template_spec['securityContext'] = {}
+    pod_security_context = pod_template_spec['securityContext']
+    pod_security_context['runAsNonRoot'] = True
+    if 'seccompProfile' not in pod_security_context:
+        pod_security_context['seccompProfile'] = {'type': 'RuntimeDefault'}
+        # This will be made conditional on OCP version >= 4.11 by injectHelmFlowControl()
+    else:
+        if pod_security_context['seccompProfile']['type'] != 'RuntimeDefault':
+            logging.warning("Leaving non-standard pod-level seccompprofile setting.")
+
+    containers = deploy['spec']['template']['spec']['containers']
+    for container in containers:
+        if 'securityContext' not in container: 
+            container['securityContext'] = {}
+        if 'env' not in container: 
+            container['env'] = {}
+        container['securityContext']['allowPrivilegeEscalation'] = False
+        container['securityContext']['capabilities'] = {}
+        container['securityContext']['capabilities']['drop'] = ['ALL']
+        container['securityContext']['privileged'] = False
+        container['securityContext']['runAsNonRoot'] = True
+        if 'readOnlyRootFilesystem' not in exclusions:
+            container['securityContext']['readOnlyRootFilesystem'] = True
+        if 'seccompProfile' in container['securityContext']:
+            if container['securityContext']['seccompProfile']['type'] == 'RuntimeDefault':
+                # Remove, to allow pod-level setting to have effect.
+                del container['securityContext']['seccompProfile']
+            else:
+                container_name = container['name']
+                logging.warning("Leaving non-standard seccompprofile setting for container %s" % container_name)
+
+# Return the deployment manifests of an AddonTemplate, or an empty list if it has no workload
+def addonTemplateDeployments(templateContent):
+    agentSpec = templateContent['spec']['agentSpec']
+    if 'workload' not in agentSpec:
+        return []
+    workload = agentSpec['workload']
+    if 'manifests' not in workload:
+        return []
+    return [manifest for manifest in workload['manifests'] if manifest['kind'] == 'Deployment']
 
 # injectAnnotationsForAddonTemplate injects following annotations for deployments in the AddonTemplate:
 # - target.workload.openshift.io/management: '{"effect": "PreferredDuringScheduling"}'
-def injectAnnotationsForAddonTemplate(helmChart):
-    logging.info("Injecting Annotations for deployments in the AddonTemplate ...")
-
-    addonTemplates = findTemplatesOfType(helmChart, 'AddOnTemplate')
-    for addonTemplate in addonTemplates:
-        injected = False
-        with open(addonTemplate, 'r') as f:
-            templateContent = yaml.safe_load(f)
-            agentSpec = templateContent['spec']['agentSpec']
-            if 'workload' not in agentSpec:
-                return
-            workload = agentSpec['workload']
-            if 'manifests' not in workload:
-                return
-            manifests = workload['manifests']
-            for manifest in manifests:
-                if manifest['kind'] == 'Deployment':
-                    metadata = manifest['spec']['template']['metadata']
-                    if 'annotations' not in metadata:
-                        metadata['annotations'] = {}
-                    if 'target.workload.openshift.io/management' not in metadata['annotations']:
-                        metadata['annotations']['target.workload.openshift.io/management'] = '{"effect": "PreferredDuringScheduling"}'
-                        injected = True
-        if injected:
-            with open(addonTemplate, 'w') as f:
-                yaml.dump(templateContent, f, width=float("inf"))
-                logging.info("Annotations injected successfully. \n")
-
-
-# fixImageReferencesForAddonTemplate identify the image references for every deployment in addontemplates, if any exist
-# in the image field, insert helm flow control code to reference it, and add image-key to the values.yaml file.
+def injectAnnotationsForAddonTemplate(templateContent):
+    for manifest in addonTemplateDeployments(templateContent):
+        metadata = manifest['spec']['template']['metadata']
+        if 'annotations' not in metadata:
+            metadata['annotations'] = {}
+        if 'target.workload.openshift.io/management' not in metadata['annotations']:
+            metadata['annotations']['target.workload.openshift.io/management'] = '{"effect": "PreferredDuringScheduling"}'
+
+
+# fixImageReferencesForAddonTemplate identify the image references for every deployment in an addontemplate, if any exist
+# in the image field, and insert helm flow control code to reference it. Returns the image-keys referenced so they can be
+# added to the values.yaml file.
 # If the image-key referenced in the addon template deployment does not exist in `imageMappings` in the Config.yaml,
 # this will fail. Images must be explicitly defined
-def fixImageReferencesForAddonTemplate(helmChart, imageKeyMapping):
-    logging.info("Fixing image references in addon templates and values.yaml ...")
-
-    addonTemplates = findTemplatesOfType(helmChart, 'AddOnTemplate')
+def fixImageReferencesForAddonTemplate(templateContent, imageKeyMapping):
     imageKeys = []
-    temp = "" ## temporarily read image ref
-    for addonTemplate in addonTemplates:
-        with open(addonTemplate, 'r') as f:
-            templateContent = yaml.safe_load(f)
-            agentSpec = templateContent['spec']['agentSpec']
-            if 'workload' not in agentSpec:
-                return
-            workload = agentSpec['workload']
-            if 'manifests' not in workload:
-                return
-            manifests = workload['manifests']
-            imageKeys = []
-            for manifest in manifests:
-                if manifest['kind'] == 'Deployment':
-                    containers = manifest['spec']['template']['spec']['containers']
-                    for container in containers:
-                        image_key = parse_image_ref(container['image'])["repository"]
-                        try:
-                            image_key = imageKeyMapping[image_key]
-                        except KeyError:
-                            logging.critical("No image key mapping provided for imageKey: %s" % image_key)
-                            exit(1)
-                        imageKeys.append(image_key)
-                        container['image'] = "{{ .Values.global.imageOverrides." + image_key + " }}"
-                        # container['imagePullPolicy'] = "{{ .Values.global.pullPolicy }}"
-        with open(addonTemplate, 'w') as f:
-            yaml.dump(templateContent, f, width=float("inf"))
-            logging.info("AddOnTemplate updated with image override successfully. \n")
-
-    if len(imageKeys) == 0:
-        return
-    valuesYaml = os.path.join(helmChart, "values.yaml")
-    with open(valuesYaml, 'r') as f:
-        values = yaml.safe_load(f)
-    if 'imageOverride' in values['global']['imageOverrides']:
-        del values['global']['imageOverrides']['imageOverride']
-    for imageKey in imageKeys:
-        values['global']['imageOverrides'][imageKey] = "" # set to temp to debug
-    with open(valuesYaml, 'w') as f:
-        yaml.dump(values, f, width=float("inf"))
-    logging.info("Image references and pull policy in addon templates and values.yaml updated successfully.\n")
-
-
-# updateRBAC adds standard configuration to the RBAC resources (clusterroles, roles, clusterrolebindings, and rolebindings)
-def updateRBAC(helmChart, chartName):
-    logging.info("Updating clusterroles, roles, clusterrolebindings, and rolebindings ...")
-    clusterroles = findTemplatesOfType(helmChart, 'ClusterRole')
-    roles = findTemplatesOfType(helmChart, 'Role')
-    clusterrolebindings = findTemplatesOfType(helmChart, 'ClusterRoleBinding')
-    rolebindings = findTemplatesOfType(helmChart, 'RoleBinding')
-
-    for rbacFile in clusterroles + roles + clusterrolebindings + rolebindings:
-        with open(rbacFile, 'r') as f:
-            rbac = yaml.safe_load(f)
-        rbac['metadata']['name'] = "{{ .Values.org }}:{{ .Chart.Name }}:" + chartName
-        if rbac['kind'] in ['RoleBinding', 'ClusterRoleBinding']:
-            rbac['roleRef']['name'] = "{{ .Values.org }}:{{ .Chart.Name }}:" + chartName
-        with open(rbacFile, 'w') as f:
-            yaml.dump(rbac, f, width=float("inf"))
-    logging.info("Clusterroles, roles, clusterrolebindings, and rolebindings updated. \n")
+    for manifest in addonTemplateDeployments(templateContent):
+        containers = manifest['spec']['template']['spec']['containers']
+        for container in containers:
+            image_key = imageRepository(container['image'])
+            try:
+                image_key = imageKeyMapping[image_key]
+            except KeyError:
+                logging.critical("No image key mapping provided for imageKey: %s" % image_key)
+                exit(1)
+            imageKeys.append(image_key)
+            container['image'] = imageOverrideRef(image_key)
+            # container['imagePullPolicy'] = "{{ .Values.global.pullPolicy }}"
+    return imageKeys
 
 
+# updateRBAC adds standard configuration to an RBAC resource (clusterrole, role, clusterrolebinding, or rolebinding)
+def updateRBAC(rbac, chartName):
+    rbac['metadata']['name'] = _RBAC_NAME_PREFIX + chartName
+    if rbac['kind'] in _RBAC_BINDING_KINDS:
+        rbac['roleRef']['name'] = _RBAC_NAME_PREFIX + chartName
+
+
+# injectRequirements applies all onboarding overrides to the chart in a single pass over its templates: each template is
+# parsed once, every update for its kind is applied in memory, and it is written back once. Deployments then get the
+# text-level helm flow control, which has to come last.
 def injectRequirements(helmChart, chartName, imageKeyMapping, skipRBACOverrides, exclusions, inclusions, branch):
     logging.info("Updating Helm chart '%s' with onboarding requirements ...", helmChart)
-    fixImageReferences(helmChart, imageKeyMapping)
-    fixEnvVarImageReferences(helmChart, imageKeyMapping)
-    fixImageReferencesForAddonTemplate(helmChart, imageKeyMapping)
-    injectAnnotationsForAddonTemplate(helmChart)
 
-    if not skipRBACOverrides:
-        updateRBAC(helmChart, chartName)
-    updateDeployments(chartName, helmChart, exclusions, inclusions, branch)
+    # Path to the values.yaml file
+    valuesYaml = os.path.join(helmChart, "values.yaml")
+    fixDeploymentImages = os.path.isfile(valuesYaml)
+    if not fixDeploymentImages:
+        logging.error("%s does not exist. Skipping image, pull policy and environment variable image reference updates.", valuesYaml)
+
+    deploySpecYaml = os.path.join(_SCRIPT_DIR, "chart-templates/templates/deploymentspec.yaml")
+    with open(deploySpecYaml, 'r') as f:
+        deploySpec = yaml.load(f, Loader=_SafeLoader)
+
+    imageKeys = []
+    addonImageKeys = []
+    deployments = []
+    for templatePath, kind, templateContent in walkChart(helmChart):
+        if kind == 'Deployment':
+            if fixDeploymentImages:
+                imageKeys += fixImageReferences(templateContent, imageKeyMapping)
+                imageKeys += fixEnvVarImageReferences(templateContent, imageKeyMapping)
+            updateDeployment(templateContent, deploySpec, exclusions)
+            deployments.append(templatePath)
+        elif kind == 'AddOnTemplate':
+            addonImageKeys += fixImageReferencesForAddonTemplate(templateContent, imageKeyMapping)
+            injectAnnotationsForAddonTemplate(templateContent)
+        elif kind in _RBAC_KINDS and not skipRBACOverrides:
+            updateRBAC(templateContent, chartName)
+        else:
+            continue
+        saveTemplate(templatePath, templateContent)
+        logging.info("Updated %s template '%s'", kind, templatePath)
+
+    if fixDeploymentImages or addonImageKeys:
+        values = loadTemplate(valuesYaml)
+        if 'imageOverride' in values['global']['imageOverrides']:
+            del values['global']['imageOverrides']['imageOverride']
+        for imageKey in imageKeys + addonImageKeys:
+            values['global']['imageOverrides'][imageKey] = "" # set to temp to debug
+        saveTemplate(valuesYaml, values)
+        logging.info("Image references and pull policy in deployments, addon templates and values.yaml updated successfully.\n")
+
+    for deployment in deployments:
+        injectHelmFlowControl(deployment, branch, 'pullSecretOverride' in inclusions)
 
     logging.info("Updated Chart '%s' successfully", helmChart)
 
@@ -718,48 +788,51 @@ def split_at(the_str, the_delim, favor_right=True):
 
 def addCRDs(repo, chart, outputDir):
     if not 'chart-path' in chart:
-        logging.critical(f"Chart path missing in the provided chart configuration: {chart}")
+        logging.critical("Chart path missing in the provided chart configuration: %s", chart)
         exit(1) 
 
-    chartPath = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, chart["chart-path"])
-    logging.debug(f"Chart path resolved to: '{chartPath}'")
+    chartPath = os.path.join(_TMP_BASE, repo, chart["chart-path"])
+    logging.debug("Chart path resolved to: '%s'", chartPath)
 
-    if not os.path.exists(chartPath):
-        logging.critical(f"Chart path not found at: {chartPath}")
+    if not os.path.isdir(chartPath):
+        logging.critical("Chart path not found at: %s", chartPath)
         exit(1)
         
     crdPath = os.path.join(chartPath, "crds")
-    if not os.path.exists(crdPath):
-        logging.info(f"No CRDs for repo: {repo}")
+    try:
+        with os.scandir(crdPath) as it:
+            crdEntries = [entry for entry in it if entry.is_file()]
+    except FileNotFoundError:
+        logging.info("No CRDs for repo: %s", repo)
         return
     
     destinationCRDPath = os.path.join(outputDir, "crds", chart['name'])
-    logging.debug(f"Destination chart path: '{destinationCRDPath}'")
+    logging.debug("Destination chart path: '%s'", destinationCRDPath)
 
-    if os.path.exists(destinationCRDPath): # If path exists, remove and re-clone
-        logging.warning(f"Destination CRDs path already exists. Removing: {destinationCRDPath}")
+    try: # If path exists, remove and re-create
         shutil.rmtree(destinationCRDPath)
+        logging.warning("Destination CRDs path already existed and was removed: %s", destinationCRDPath)
+    except FileNotFoundError:
+        pass
 
-    os.makedirs(destinationCRDPath)
-    logging.info(f"Created destination path for CRDs: {destinationCRDPath}")
+    os.makedirs(destinationCRDPath, exist_ok=True)
+    logging.info("Created destination path for CRDs: %s", destinationCRDPath)
 
-    for filename in os.listdir(crdPath):
+    for entry in crdEntries:
+        filename = entry.name
         if not filename.endswith(".yaml"): 
-            logging.debug(f"File '{filename}' is not a YAML file. Skipping processing.")
+            logging.debug("File '%s' is not a YAML file. Skipping processing.", filename)
             continue
 
-        filepath = os.path.join(crdPath, filename)
-        with open(filepath, 'r') as f:
-            resourceFile = yaml.safe_load(f)
-
-        if resourceFile["kind"] == "CustomResourceDefinition":
+        filepath = entry.path
+        if readKind(filepath) == "CustomResourceDefinition":
             targetPath = os.path.join(destinationCRDPath, filename)
             shutil.copyfile(filepath, targetPath)
-            logging.info(f"Generated CRD file '{filename}'")
+            logging.info("Generated CRD file '%s'", filename)
         else:
-            logging.debug(f"Skipping file '{filename}' as it does not contain a CRD.")
+            logging.debug("Skipping file '%s' as it does not contain a CRD.", filename)
 
-    logging.info(f"Finished processing CRDs for chart '{chart['name']}'\n")
+    logging.info("Finished processing CRDs for chart '%s'\n", chart['name'])
 
 def chartConfigAcceptable(chart):
     helmChart = chart["name"]
@@ -768,6 +841,9 @@ def chartConfigAcceptable(chart):
         return False
     return True
 
+# Release branches are named release-X.Y or backplane-X.Y; the numeric part is the chart version
+_CHART_VERSION_BRANCH_RE = re.compile(r'^(?:release-|backplane-)?(\d+(?:\.\d+)*)$')
+
 def getChartVersion(updateChartVersion, repo):
     chartVersion = ""
     if not updateChartVersion:
@@ -775,34 +851,93 @@ def getChartVersion(updateChartVersion, repo):
         return chartVersion
 
     repo_name = repo.get("repo_name", "")
-    logging.info(f"Calculating chart version for repository '{repo_name}'")
+    logging.info("Calculating chart version for repository '%s'", repo_name)
 
     if 'branch' not in repo:
-        logging.warning(f"No branch specified for repository '{repo_name}', skipping chart version calculation")
+        logging.warning("No branch specified for repository '%s', skipping chart version calculation", repo_name)
         return chartVersion
     
     branch_name = repo['branch']
-    logging.debug(f"Processing branch name: {branch_name}")
+    logging.debug("Processing branch name: %s", branch_name)
 
-    version = branch_name.replace("release-", "").replace("backplane-", "")
-    logging.debug(f"Extracted version after removing prefix: {version}")
-
-    if not version.replace(".", "").isdecimal():
+    match = _CHART_VERSION_BRANCH_RE.match(branch_name)
+    if not match:
         logging.warning("Unable to use branch name '%s' as chart version for repo '%s', skip.", branch_name, repo_name)
         return chartVersion
 
-    chartVersion = version
-    logging.info(f"Detected chart version: {chartVersion}\n")
+    chartVersion = match.group(1)
+    logging.info("Detected chart version: %s\n", chartVersion)
 
     return chartVersion
 
+# Record of the inputs each generated chart was last built from, and a hash of what it generated, keyed
+# by destination chart path
+_CHART_HASHES_FILE = os.path.join(_SCRIPT_DIR, ".chart-hashes.json")
+
+def loadChartHashes():
+    try:
+        with open(_CHART_HASHES_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def saveChartHashes(chartHashes):
+    with open(_CHART_HASHES_FILE, 'w') as f:
+        json.dump(chartHashes, f, indent=2, sort_keys=True)
+
+# Return the version of the helm binary that renders the charts, or "" if helm isn't available
+def helmVersion():
+    try:
+        result = subprocess.run(['helm', 'version', '--short'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+    except FileNotFoundError:
+        return ""
+    return result.stdout.strip()
+
+# Fingerprint everything a generated chart is derived from: the chart's source directory in the cloned
+# repo, its chart-values override, the chart-templates copied into every chart, the chart configuration
+# and options, the helm version and this script itself. Must be computed before copyHelmChart, which
+# edits the cloned chart in place.
+def chartFingerprint(repo, chart, branch, chartVersion, skipOverrides, helm):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([chart, branch, chartVersion, skipOverrides, helm], sort_keys=True, default=str).encode())
+
+    sources = [
+        _SCRIPT_PATH,
+        os.path.join(_SCRIPT_DIR, "chart-values", chart['name'], "values.yaml"),
+    ]
+    for sourceDir in (os.path.join(_SCRIPT_DIR, "chart-templates"), os.path.join(_TMP_BASE, repo, chart["chart-path"])):
+        for root, dirs, files in os.walk(sourceDir):
+            dirs.sort()
+            sources += [os.path.join(root, filename) for filename in sorted(files)]
+
+    for source in sources:
+        digest.update(os.path.relpath(source, _SCRIPT_DIR).encode())
+        if os.path.isfile(source):
+            with open(source, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+# Hash the names and contents of every file generated for a chart: its chart directory and its CRDs
+def chartOutputHash(destination, chart):
+    digest = hashlib.blake2b(digest_size=16)
+    for outputDir in (os.path.join(destination, "charts", chart['always-or-toggle'], chart['name']),
+                      os.path.join(destination, "crds", chart['name'])):
+        for root, dirs, files in os.walk(outputDir):
+            dirs.sort()
+            for filename in sorted(files):
+                filePath = os.path.join(root, filename)
+                digest.update(os.path.relpath(filePath, destination).encode())
+                with open(filePath, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
 def renderChart(chart_path):
     # Define the path for the values.yaml file
     values_file_path = os.path.join(chart_path, 'values.yaml')
-    
-    # Load the values from the values.yaml file
-    with open(values_file_path, 'r') as f:
-        values = yaml.safe_load(f)
+    if not os.path.isfile(values_file_path):
+        logging.error("Missing values.yaml for chart '%s' at path: %s", chart_path, values_file_path)
+        return False
 
     try:
         # Use the Helm command to render the chart
@@ -820,19 +955,114 @@ def renderChart(chart_path):
         logging.error("Error rendering chart: %s", e.stderr.decode())
         return False
 
+# Name of the directory under tmp/ a repo from the charts config is cloned into. Entries for the same repo
+# on different branches get one each, since every repo is cloned before any chart is generated.
+def cloneDirName(repo):
+    branch = repo.get('branch')
+    if not branch:
+        return repo["repo_name"]
+    return "%s@%s" % (repo["repo_name"], branch.replace('/', '_'))
+
+# Bring an existing clone of the repo up to date with the configured branch. Returns False if the
+# clone can't be reused (missing, corrupt or cloned from another remote) and must be recreated.
+def refreshClone(repo, repo_path):
+    try:
+        existing = Repo(repo_path)
+        if existing.remotes.origin.url != repo["github_ref"]:
+            return False
+        existing.remotes.origin.fetch(refspec=repo.get('branch', 'HEAD'), depth=1)
+        existing.git.checkout('--force', 'FETCH_HEAD')
+        existing.git.clean('-ffdxq')
+    except (exc.GitError, AttributeError, IndexError, ValueError) as e:
+        logging.warning("Unable to reuse the existing clone of %s, re-cloning: %s", repo["repo_name"], e)
+        return False
+    return True
+
+# Clone a repo from the charts config into the tmp directory. Only the tip of the configured branch (or of
+# the default branch) is fetched, since the charts are generated from its current content alone.
+def cloneRepo(repo, reuse=False):
+    repo_path = os.path.join(_TMP_BASE, cloneDirName(repo)) # Path to clone repo to
+    if reuse and refreshClone(repo, repo_path):
+        logging.info("Reusing existing clone: %s", repo["repo_name"])
+        return
+
+    logging.info("Cloning: %s", repo["repo_name"])
+    try: # If path exists, remove and re-clone
+        shutil.rmtree(repo_path)
+    except FileNotFoundError:
+        pass
+
+    cloneOptions = ['--depth=1', '--single-branch']
+    if 'branch' in repo:
+        cloneOptions.append('--branch=' + repo['branch']) # If a branch is specified, clone that branch
+    Repo.clone_from(repo["github_ref"], repo_path, multi_options=cloneOptions)
+
+# Generate a single chart from its cloned repo: copy its CRDs, template and render the chart, update its
+# resources and, unless skipped, inject the onboarding requirements. Returns False if any step logged an error.
+def processChart(repoName, chart, branch, chartVersion, destination, skipOverrides, parallelTemplates=True):
+    chart_name = chart.get("name", "")
+    always_or_toggle = chart['always-or-toggle']
+    destinationChartPath = os.path.join(destination, "charts", always_or_toggle, chart['name'])
+
+    logging.info("Helm Chartifying: '%s'", chart_name)
+
+    # Copy over all CRDs to the destination directory
+    logging.info("Adding CRDs for chart: '%s'", chart_name)
+    addCRDs(repoName, chart, destination)
+
+    logging.info("Creating helm chart: '%s'", chart_name)
+
+    # Template Helm Chart Directory from 'chart-templates'
+    logging.info("Templating helm chart '%s'", chart_name)
+    succeeded = copyHelmChart(destinationChartPath, repoName, chart, chartVersion)
+
+    # Render the helm chart before updating the chart resources.
+    if not renderChart(destinationChartPath):
+        logging.error("Failed to render chart %s", destinationChartPath)
+        succeeded = False
+    
+    # Update the helm chart resources with additional overrides
+    if not updateResources(destination, repoName, chart, parallelTemplates):
+        succeeded = False
+
+    if not skipOverrides:
+        logging.info("Adding Overrides (set --skipOverrides=true to skip) ...")
+        image_mappings = chart.get("imageMappings", {})
+        exclusions = frozenset(chart.get("exclusions") or ())
+        inclusions = frozenset(chart.get("inclusions") or ())
+        skip_rbac_overrides = chart.get("skipRBACOverrides", False)
+
+        injectRequirements(destinationChartPath, chart_name, image_mappings, skip_rbac_overrides, exclusions,
+                           inclusions, branch)
+        logging.info("Overrides added.\n")
+    return succeeded
+
+# Generate, one after another, charts that are built from the same chart directory of a cloned repo,
+# since generating a chart edits its Chart.yaml and values.yaml in place. Returns processChart's result
+# for each chart.
+def processChartGroup(charts, destination, skipOverrides):
+    return [processChart(repoName, chart, branch, chartVersion, destination, skipOverrides, False)
+            for repoName, chart, branch, chartVersion in charts]
+
 def main():
     ## Initialize ArgParser
     parser = argparse.ArgumentParser()
     parser.add_argument("--destination", dest="destination", type=str, required=False, help="Destination directory of the created helm chart")
     parser.add_argument("--skipOverrides", dest="skipOverrides", type=bool, help="If true, overrides such as helm flow control will not be applied")
     parser.add_argument("--lint", dest="lint", action='store_true', help="If true, bundles will only be linted to ensure they can be transformed successfully. Default is False.")
+    parser.add_argument("--changedOnly", dest="changedOnly", action='store_true', help="If true, charts whose sources, configuration, generator and helm version are unchanged since the last run, and whose generated output hasn't been modified since, are not regenerated. Default is False.")
     parser.set_defaults(skipOverrides=False)
     parser.set_defaults(lint=False)
+    parser.add_argument("--reuseClones", dest="reuseClones", action='store_true', help="If true, repos cloned by a previous run are fetched and checked out instead of re-cloned, and are kept after this run. Default is False.")
+    parser.set_defaults(changedOnly=False)
+    parser.set_defaults(reuseClones=False)
 
     args = parser.parse_args()
     skipOverrides = args.skipOverrides
     destination = args.destination
     lint = args.lint
+    changedOnly = args.changedOnly
+    reuseClones = args.reuseClones
 
     if lint == False and not destination:
         logging.critical("Destination directory is required when not linting.")
@@ -841,27 +1071,29 @@ def main():
     logging.basicConfig(level=logging.DEBUG)
 
     # Config.yaml holds the configurations for Operator bundle locations to be used
-    configYaml = os.path.join(os.path.dirname(os.path.realpath(__file__)),"charts-config.yaml")
+    configYaml = os.path.join(_SCRIPT_DIR,"charts-config.yaml")
     with open(configYaml, 'r') as f:
-        config = yaml.safe_load(f)
+        config = yaml.load(f, Loader=_SafeLoader)
 
     if not config:
         logging.critical("No charts listed in config to be moved!")
         exit(0)
 
+    # Charts are only fingerprinted, and the fingerprints only stored, when unchanged charts are to be skipped
+    chartHashes = loadChartHashes() if changedOnly else {}
+    helm = helmVersion() if changedOnly else ""
+    charts = [] # (repo name, chart, branch, chart version, chart key, fingerprint) of each chart to generate
+
+    # Clone every repo up front. Clones are network bound, so run them concurrently, cloning repos that
+    # more than one config entry uses only once so no two clones share a directory
+    repos = list({cloneDirName(repo): repo for repo in config}.values())
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(repos), 8)) as executor:
+        list(executor.map(functools.partial(cloneRepo, reuse=reuseClones), repos))
+
     # Loop through each repo in the config.yaml
     for repo in config:
-        logging.info("Cloning: %s", repo["repo_name"])
-        repo_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp/" + repo["repo_name"]) # Path to clone repo to
-        if os.path.exists(repo_path): # If path exists, remove and re-clone
-            shutil.rmtree(repo_path)
-        repository = Repo.clone_from(repo["github_ref"], repo_path) # Clone repo to above path
-
-        if 'branch' in repo:
-            branch = repo['branch']
-            repository.git.checkout(branch) # If a branch is specified, checkout that branch
-        else:
-            branch = ""
+        branch = repo.get('branch', "")
+        cloneName = cloneDirName(repo)
         
         # Loop through each operator in the repo identified by the config
         for chart in repo["charts"]:
@@ -870,13 +1102,6 @@ def main():
                 exit(1)
 
             chart_name = chart.get("name", "")
-            logging.info(f"Helm Chartifying: '{chart_name}'")
-
-            # Copy over all CRDs to the destination directory
-            logging.info(f"Adding CRDs for chart: '{chart_name}'")
-            addCRDs(repo["repo_name"], chart, destination)
-
-            logging.info(f"Creating helm chart: '{chart_name}'")
             always_or_toggle = chart['always-or-toggle']
             destinationChartPath = os.path.join(destination, "charts", always_or_toggle, chart['name'])
 
@@ -884,33 +1109,54 @@ def main():
             # ensuring the version is derived from the repository branch when applicable.
             chartVersion = getChartVersion(chart['updateChartVersion'], repo)
 
-            # Template Helm Chart Directory from 'chart-templates'
-            logging.info(f"Templating helm chart '{chart_name}'")
-            copyHelmChart(destinationChartPath, repo["repo_name"], chart, chartVersion)
-
-            # Render the helm chart before updating the chart resources.
-            if not renderChart(destinationChartPath):
-                logging.error(f"Failed to render chart {destinationChartPath}")
-            
-            # Update the helm chart resources with additional overrides
-            updateResources(destination, repo["repo_name"], chart)
-
-            if not skipOverrides:
-                logging.info("Adding Overrides (set --skipOverrides=true to skip) ...")
-                image_mappings = chart.get("imageMappings", {})
-                exclusions = chart.get("exclusions", [])
-                inclusions = chart.get("inclusions", [])
-                skip_rbac_overrides = chart.get("skipRBACOverrides", False)
+            chartKey = os.path.abspath(destinationChartPath)
+            fingerprint = None
+            if changedOnly:
+                fingerprint = chartFingerprint(cloneName, chart, branch, chartVersion, skipOverrides, helm)
+                # Skip only if the inputs match and the generated chart is still exactly what was generated
+                recorded = chartHashes.get(chartKey)
+                if (isinstance(recorded, dict) and recorded.get('inputs') == fingerprint and os.path.isdir(destinationChartPath)
+                        and recorded.get('output') == chartOutputHash(destination, chart)):
+                    logging.info("Chart '%s' is unchanged since the last run, skipping", chart_name)
+                    continue
 
-                injectRequirements(destinationChartPath, chart_name, image_mappings, skip_rbac_overrides, exclusions,
-                                   inclusions, branch)
-                logging.info("Overrides added.\n")
+            charts.append((cloneName, chart, branch, chartVersion, chartKey, fingerprint))
+
+    # Charts built from different chart directories are independent of each other, so generate them in
+    # parallel, keeping charts that share a chart directory on the same worker. Each worker then updates
+    # its charts' templates serially rather than starting a process pool of its own.
+    chartGroups = {}
+    for index, (repoName, chart, _, _, _, _) in enumerate(charts):
+        chartGroups.setdefault((repoName, os.path.normpath(chart["chart-path"])), []).append(index)
+    if len(chartGroups) > 1:
+        results = [None] * len(charts)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(len(chartGroups), os.cpu_count() or 1)) as executor:
+            futures = [(executor.submit(processChartGroup, [charts[index][:4] for index in indices], destination, skipOverrides), indices)
+                       for indices in chartGroups.values()]
+            for future, indices in futures:
+                for index, succeeded in zip(indices, future.result()):
+                    results[index] = succeeded
+    else:
+        results = [processChart(repoName, chart, branch, chartVersion, destination, skipOverrides)
+                   for repoName, chart, branch, chartVersion, _, _ in charts]
+
+    # Only record charts that generated cleanly, so a failed chart is retried by the next --changedOnly run
+    if changedOnly:
+        for (_, chart, _, _, chartKey, fingerprint), succeeded in zip(charts, results):
+            if succeeded:
+                chartHashes[chartKey] = {'inputs': fingerprint, 'output': chartOutputHash(destination, chart)}
+            else:
+                chartHashes.pop(chartKey, None)
+        saveChartHashes(chartHashes)
 
     logging.info("All repositories and operators processed successfully.")
-    logging.info("Performing cleanup...")
-    shutil.rmtree((os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp")), ignore_errors=True)
+    if reuseClones:
+        logging.info("Keeping cloned repos for the next run.")
+    else:
+        logging.info("Performing cleanup...")
+        shutil.rmtree(_TMP_BASE, ignore_errors=True)
+        logging.info("Cleanup completed.")
 
-    logging.info("Cleanup completed.")
     logging.info("Script execution completed.")
 
 if __name__ == "__main__":
@@ -18,6 +18,10 @@ from git import Repo
 # Configure logging with coloredlogs
 coloredlogs.install(level='DEBUG')  # Set the logging level as needed
 
+# Directory of this script, and the directory the source repos are cloned into
+_SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+_TMP_BASE = os.path.join(_SCRIPT_DIR, "tmp")
+
 def save_yaml(file_path, yaml_data):
     """
     Save YAML data to a file.
@@ -68,8 +72,8 @@ def clone_pipeline_repo(org, repo_name, branch, target_path, pat=None):
         logging.warning("Personal Access Token (PAT) not provided. Cloning without authentication.")
         clone_url = f"https://github.com/{org}/{repo_name}.git"
 
-    repository = Repo.clone_from(clone_url, target_path)
-    repository.git.checkout(branch)
+    # Only the branch tip is read, so skip the history and the other branches
+    Repo.clone_from(clone_url, target_path, multi_options=['--depth=1', '--single-branch', '--branch=' + branch])
 
 def fetch_latest_manifest(dir_path):
     """
@@ -120,13 +124,13 @@ def main():
     args = parser.parse_args()
 
     # Load configuration
-    configYaml = os.path.join(os.path.dirname(os.path.realpath(__file__)), "config.yaml")
+    configYaml = os.path.join(_SCRIPT_DIR, "config.yaml")
     logging.info("Loading configuration from: %s" % configYaml)
     with open(configYaml, 'r') as f:
         config = yaml.safe_load(f)
 
     # Clone pipeline repository into temporary directory path.
-    repo_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), f"tmp/{args.repo}")
+    repo_directory = os.path.join(_TMP_BASE, args.repo)
     if os.path.exists(repo_directory): # If path exists, remove and re-clone
         logging.warning("The repository directory already exists, removing directory at: %s" % repo_directory)
         shutil.rmtree(repo_directory)
@@ -170,7 +174,7 @@ def main():
             
     logging.info("All repositories and operators processed successfully.")
     logging.info("Performing cleanup...")
-    shutil.rmtree((os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp")), ignore_errors=True)
+    shutil.rmtree(_TMP_BASE, ignore_errors=True)
 
     logging.info("Cleanup completed.")
     logging.info("Script execution completed.")
@@ -4,15 +4,39 @@
 # Assumes: Python 3.6+
 
 import argparse
+import concurrent.futures
+import functools
 import os
+import re
 import shutil
 import yaml
 import logging
 import subprocess
+import tarfile
+import urllib.error
+import urllib.request
 from git import Repo, exc
 
 from validate_csv import *
 
+# Parse with libyaml when PyYAML was built against it, falling back to the pure-Python loader
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+
+# Directory of this script, and the directory the source repos are cloned into
+_SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+_TMP_BASE = os.path.join(_SCRIPT_DIR, "tmp")
+
+# Place the content of source at destination. The cloned repos under tmp/ are deleted at the end of
+# the run, so a hard link is as good as a copy; copy instead when they're on different filesystems.
+def linkOrCopy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
 # Copy chart-templates to a new helmchart directory
 import os
 import shutil
@@ -20,78 +44,164 @@ import logging
 
 def copyHelmChart(destinationChartPath, repo, chart):
     chartName = chart['name']
-    logging.info(f"Copying templates into new {chartName} chart directory ...")
+    logging.info("Copying templates into new %s chart directory ...", chartName)
 
     # Create main folder
-    chartPath = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, chart["chart-path"])
-    if os.path.exists(destinationChartPath):
-        logging.info(f"Removing existing directory at: {destinationChartPath}")
+    chartPath = os.path.join(_TMP_BASE, repo, chart["chart-path"])
+    try:
         shutil.rmtree(destinationChartPath)
+        logging.info("Removed existing directory at: %s", destinationChartPath)
+    except FileNotFoundError:
+        pass
 
     # Copy Chart.yaml, values.yaml, and templates dir
     chartTemplatesPath = os.path.join(chartPath, "templates/")
     destinationTemplateDir = os.path.join(destinationChartPath, "templates/")
-    os.makedirs(destinationTemplateDir)
-    logging.debug(f"Created destination template directory at: {destinationTemplateDir}")
+    os.makedirs(destinationTemplateDir, exist_ok=True)
+    logging.debug("Created destination template directory at: %s", destinationTemplateDir)
 
     # Fetch template files
-    logging.info(f"Copying template files from '{chartTemplatesPath}' to '{destinationTemplateDir}'")
-    for file_name in os.listdir(chartTemplatesPath):
-        # Construct full file path
-        source = os.path.join(chartTemplatesPath, file_name)
-        destination = os.path.join(destinationTemplateDir, file_name)
-
-        # Copy only files
-        if os.path.isfile(source):
-            logging.debug(f"Copying file '{source}' to '{destination}'")
-            shutil.copyfile(source, destination)
-        else:
-            logging.warning(f"Skipping non-file item: {source}")
+    logging.info("Copying template files from '%s' to '%s'", chartTemplatesPath, destinationTemplateDir)
+    # destinationTemplateDir already ends in a separator, so file names can be appended to it directly
+    with os.scandir(chartTemplatesPath) as it:
+        for entry in it:
+            source = entry.path
+            destination = destinationTemplateDir + entry.name
+
+            # Copy only files
+            if entry.is_file():
+                logging.debug("Copying file '%s' to '%s'", source, destination)
+                linkOrCopy(source, destination)
+            else:
+                logging.warning("Skipping non-file item: %s", source)
 
     chartYamlPath = os.path.join(chartPath, "Chart.yaml")
     if not os.path.exists(chartYamlPath):
-        logging.error(f"No Chart.yaml found for chart: '{chartName}'")
+        logging.error("No Chart.yaml found for chart: '%s'", chartName)
         return
 
     logging.info("Copying Chart.yaml to '%s'", os.path.join(destinationChartPath, "Chart.yaml"))
-    shutil.copyfile(chartYamlPath, os.path.join(destinationChartPath, "Chart.yaml"))
+    linkOrCopy(chartYamlPath, os.path.join(destinationChartPath, "Chart.yaml"))
 
     valuesYamlPath = os.path.join(chartPath, "values.yaml")
     if not os.path.exists(valuesYamlPath):
-        logging.error(f"No values.yaml found for chart: '{chartName}'")
+        logging.error("No values.yaml found for chart: '%s'", chartName)
         return
 
-    shutil.copyfile(valuesYamlPath, os.path.join(destinationChartPath, "values.yaml"))
+    linkOrCopy(valuesYamlPath, os.path.join(destinationChartPath, "values.yaml"))
     logging.info("Chart copied.\n")
 
+_KIND_LINE_RE = re.compile(r'^kind:\s*["\']?([\w.-]+)', re.MULTILINE)
+
+# Return whether any document in a YAML file is of the given kind. A file whose first top-level
+# `kind:` line matches is accepted without parsing, and one that never mentions the kind is rejected;
+# anything else has its documents streamed until a match is found.
+def containsKind(filePath, kind):
+    with open(filePath, 'r') as f:
+        content = f.read()
+    match = _KIND_LINE_RE.search(content)
+    if match and match.group(1) == kind:
+        return True
+    if kind not in content:
+        return False
+    for doc in yaml.load_all(content, Loader=_SafeLoader):
+        if isinstance(doc, dict) and doc.get('kind') == kind:
+            return True
+    return False
+
 def addCRDs(repo, chart, outputDir):
     if not 'chart-path' in chart:
         logging.critical("Could not validate chart path in given chart: " + chart)
         exit(1) 
 
-    chartPath = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp", repo, chart["chart-path"])
+    chartPath = os.path.join(_TMP_BASE, repo, chart["chart-path"])
     if not os.path.exists(chartPath):
         logging.critical("Could not validate chartPath at given path: " + chartPath)
         exit(1)
     
     crdPath = os.path.join(chartPath, "crds")
     if not os.path.exists(crdPath):
-        logging.info(f"No CRDs for repo: {repo}")
+        logging.info("No CRDs for repo: %s", repo)
         return
 
     destinationPath = os.path.join(outputDir, "crds", chart['name'])
-    if os.path.exists(destinationPath): # If path exists, remove and re-clone
+    try: # If path exists, remove and re-create
         shutil.rmtree(destinationPath)
-    os.makedirs(destinationPath)
-    for filename in os.listdir(crdPath):
-        if not filename.endswith(".yaml"): 
-            continue
-        filepath = os.path.join(crdPath, filename)
-        with open(filepath, 'r') as f:
-            resourceFile = yaml.safe_load(f)
+    except FileNotFoundError:
+        pass
+    os.makedirs(destinationPath, exist_ok=True)
+    with os.scandir(crdPath) as it:
+        crdFiles = [(entry.name, entry.path) for entry in it if entry.name.endswith(".yaml")]
+    destinationPrefix = os.path.join(destinationPath, "")
+    for filename, filepath in crdFiles:
+        if containsKind(filepath, "CustomResourceDefinition"):
+            linkOrCopy(filepath, destinationPrefix + filename)
+
+_GITHUB_URL_RE = re.compile(r'^https://github\.com/([\w.-]+?)/([\w.-]+?)(?:\.git)?/?$')
+
+# Seconds to wait on the codeload connection before giving up on the download and cloning instead
+_DOWNLOAD_TIMEOUT = 60
+
+# Have tarfile refuse members that would be written outside the destination, on Pythons that support it
+_TAR_EXTRACT_OPTIONS = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
+# Return whether path, once any links in it are followed, is root or somewhere below it
+def resolvesInside(path, root):
+    path = os.path.realpath(path)
+    return path == root or path.startswith(root + os.sep)
+
+# Fetch only the given chart paths of a GitHub repo into repoPath, from the repo's codeload tarball
+# rather than a clone, so no .git/ metadata or unrelated files are written. Returns False when the repo
+# can't be fetched this way (not a public github.com URL, the download fails, or a chart links to files
+# the download doesn't include) so it can be cloned.
+def downloadCharts(githubRef, branch, chartPaths, repoPath):
+    match = _GITHUB_URL_RE.match(githubRef)
+    if not match:
+        return False
 
-        if resourceFile["kind"] == "CustomResourceDefinition":
-            shutil.copyfile(filepath, os.path.join(destinationPath, filename))
+    url = "https://codeload.github.com/%s/%s/tar.gz/%s" % (match.group(1), match.group(2), branch or "HEAD")
+    prefixes = set()
+    for chartPath in chartPaths:
+        chartPath = os.path.normpath(chartPath).strip('/')
+        prefixes.add('' if chartPath == '.' else chartPath + '/')
+    prefixes = tuple(prefixes)
+
+    # Members are written through, and charts read through, the links already extracted, so everything
+    # is checked against where it really resolves to
+    root = os.path.realpath(repoPath)
+
+    logging.info("Downloading %s", url)
+    try:
+        links = []
+        with urllib.request.urlopen(url, timeout=_DOWNLOAD_TIMEOUT) as response, tarfile.open(fileobj=response, mode='r|gz') as tar:
+            for member in tar:
+                # Every member sits under a single top-level <repo>-<sha>/ directory
+                _, sep, name = member.name.partition('/')
+                if not sep or not name.startswith(prefixes) or '..' in name.split('/'):
+                    continue
+                if not (member.isfile() or member.isdir() or member.issym()):
+                    continue
+                destination = os.path.join(repoPath, name)
+                if not resolvesInside(os.path.dirname(destination), root):
+                    raise ValueError("%s would be written outside the repo" % name)
+                if member.issym():
+                    if os.path.isabs(member.linkname) or not resolvesInside(os.path.join(os.path.dirname(destination), member.linkname), root):
+                        raise ValueError("%s links outside the repo" % name)
+                    links.append(destination)
+                member.name = name
+                tar.extract(member, repoPath, **_TAR_EXTRACT_OPTIONS)
+        # A link extracted later can change where an earlier one resolves to. Links to files that weren't
+        # extracted (outside the chart paths, or export-ignored) only resolve in a clone
+        for link in links:
+            if not resolvesInside(link, root):
+                raise ValueError("%s links outside the repo" % os.path.relpath(link, repoPath))
+            if not os.path.exists(link):
+                raise ValueError("%s links to a file missing from the download" % os.path.relpath(link, repoPath))
+    except (OSError, ValueError, tarfile.TarError) as e: # URLError and socket.timeout are OSErrors
+        logging.warning("Could not download %s, falling back to cloning: %s", url, e)
+        shutil.rmtree(repoPath, ignore_errors=True)
+        return False
+    return True
 
 def chartConfigAcceptable(chart):
     helmChart = chart["name"]
@@ -100,6 +210,66 @@ def chartConfigAcceptable(chart):
         return False
     return True
 
+# Name of the directory under tmp/ a repo from the config is cloned into. Entries for the same repo on
+# different branches get one each, so they can be processed at the same time.
+def cloneDirName(repo):
+    branch = repo.get('branch')
+    if not branch:
+        return repo["repo_name"]
+    return "%s@%s" % (repo["repo_name"], branch.replace('/', '_'))
+
+# Clone a repo from the config and copy each of its charts, with their CRDs, to the destination
+def processRepo(repo, destination):
+    logging.info("Fetching: %s", repo["repo_name"])
+    cloneName = cloneDirName(repo)
+    repo_path = os.path.join(_TMP_BASE, cloneName) # Path to clone repo to
+    try: # If path exists, remove and re-clone
+        shutil.rmtree(repo_path)
+    except FileNotFoundError:
+        pass
+
+    chartPaths = [chart.get("chart-path", "") for chart in repo["charts"]]
+    if not downloadCharts(repo["github_ref"], repo.get('branch'), chartPaths, repo_path):
+        cloneOptions = ['--depth=1', '--single-branch']
+        if 'branch' in repo:
+            cloneOptions.append('--branch=' + repo['branch']) # If a branch is specified, clone that branch
+        Repo.clone_from(repo["github_ref"], repo_path, multi_options=cloneOptions) # Clone repo to above path
+
+    for chart in repo["charts"]:
+        if not chartConfigAcceptable(chart):
+            logging.critical("Unable to generate helm chart without configuration requirements.")
+            exit(1)
+
+    # Charts only read the clone and each writes to its own destination, so copy them concurrently too
+    if len(repo["charts"]) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(repo["charts"]), 4)) as executor:
+            list(executor.map(functools.partial(processChart, cloneName, destination=destination), repo["charts"]))
+    else:
+        for chart in repo["charts"]:
+            processChart(cloneName, chart, destination)
+
+# Process config entries that share a clone directory one after another, each replacing the last's clone
+def processRepos(repos, destination):
+    for repo in repos:
+        processRepo(repo, destination)
+
+# Copy a single chart, and its CRDs, from a cloned repo to the destination
+def processChart(repoName, chart, destination):
+    logging.info("Helm Chartifying -  %s (repo: %s)!\n", chart["name"], repoName)
+
+    logging.info("Adding CRDs -  %s!\n", chart["name"])
+    # Copy over all CRDs to the destination directory
+    addCRDs(repoName, chart, destination)
+
+    logging.info("Creating helm chart: '%s' ...", chart["name"])
+
+    always_or_toggle = chart['always-or-toggle']
+    destinationChartPath = os.path.join(destination, "charts", always_or_toggle, chart['name'])
+
+    # Template Helm Chart Directory from 'chart-templates'
+    logging.info("Templating helm chart '%s' ...", chart["name"])
+    copyHelmChart(destinationChartPath, repoName, chart)
+
 def main():
     ## Initialize ArgParser
     parser = argparse.ArgumentParser()
@@ -111,45 +281,21 @@ def main():
     logging.basicConfig(level=logging.DEBUG)
 
     # Config.yaml holds the configurations for Operator bundle locations to be used
-    configYaml = os.path.join(os.path.dirname(os.path.realpath(__file__)), "copy-config.yaml")
+    configYaml = os.path.join(_SCRIPT_DIR, "copy-config.yaml")
     with open(configYaml, 'r') as f:
-        config = yaml.safe_load(f)
+        config = yaml.load(f, Loader=_SafeLoader)
 
-    # Loop through each repo in the config.yaml
+    # Repos are independent of each other and cloning them is network bound, so process them concurrently.
+    # Entries that would clone into the same directory are kept together and processed in order.
+    repoGroups = {}
     for repo in config:
-        logging.info("Cloning: %s", repo["repo_name"])
-        repo_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp/" + repo["repo_name"]) # Path to clone repo to
-        if os.path.exists(repo_path): # If path exists, remove and re-clone
-            shutil.rmtree(repo_path)
-
-        repository = Repo.clone_from(repo["github_ref"], repo_path) # Clone repo to above path
-        if 'branch' in repo:
-            repository.git.checkout(repo['branch']) # If a branch is specified, checkout that branch
-
-        # Loop through each operator in the repo identified by the config
-        for chart in repo["charts"]:
-            if not chartConfigAcceptable(chart):
-                logging.critical("Unable to generate helm chart without configuration requirements.")
-                exit(1)
-
-            logging.info("Helm Chartifying -  %s!\n", chart["name"])
-
-            logging.info("Adding CRDs -  %s!\n", chart["name"])
-            # Copy over all CRDs to the destination directory
-            addCRDs(repo["repo_name"], chart, destination)
-
-            logging.info("Creating helm chart: '%s' ...", chart["name"])
-
-            always_or_toggle = chart['always-or-toggle']
-            destinationChartPath = os.path.join(destination, "charts", always_or_toggle, chart['name'])
-
-            # Template Helm Chart Directory from 'chart-templates'
-            logging.info("Templating helm chart '%s' ...", chart["name"])
-            copyHelmChart(destinationChartPath, repo["repo_name"], chart)
+        repoGroups.setdefault(cloneDirName(repo), []).append(repo)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(len(repoGroups), 8))) as executor:
+        list(executor.map(functools.partial(processRepos, destination=destination), repoGroups.values()))
 
     logging.info("All repositories and operators processed successfully.")
     logging.info("Performing cleanup...")
-    shutil.rmtree((os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp")), ignore_errors=True)
+    shutil.rmtree(_TMP_BASE, ignore_errors=True)
 
     logging.info("Cleanup completed.")
     logging.info("Script execution completed.")